@@ -0,0 +1,90 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# The interface between a store of storage time series and the Handler
+# To analyze data from your own water-resources database, subclass StorageAdapter and define
+#   read(station_ids, start, end, dur_code)  ->  {station_id: (times, values)}, or None if it failed
+#   get_name(station_id)                     ->  the reservoir name, for titles (optional)
+# read returns the readings of each station from the start date through the end date, as arrays:
+# times as datetime64 and values as float acre-feet.  fill and fill_many then screen the readings
+# and load them into Handlers.  Adapters in this package:
+#   cdecpuller.CdecDailyResAdapter   the CDEC JSON data servlet, optionally through a cdeccache.CdecCache
+#   archive.ArchiveAdapter           a local SQLite or memory-mapped archive of series (see archive.py)
+from datetime import timedelta
+import numpy as np
+import storagehandler, instrument
+
+def screen(values):
+    'Replaces negative values with the last one before it which was not negative'
+    # rudimentary bad-data screening, needs work!  Negatives before the first good value are kept.
+    # For more, pass a screening.Screen to the adapter.
+    good = ~(values < 0)
+    last_good = np.maximum.accumulate(np.where(good, np.arange(len(values)), -1))
+    return np.where(last_good >= 0, values[np.maximum(last_good, 0)], values)
+
+def fetch_end(start, nbr_years):
+    'The last date fetched for nbr_years water years starting at start, with two months to spare'
+    return start + timedelta(366 * nbr_years + 62)
+
+class StorageAdapter:
+    'Base of the adapters which load storage time series into Handlers'
+    # Pass a screening.Screen as screen to screen each record in place of the simple screen();
+    # its quality report for each station is then kept in reports.
+    source = 'storage'  # for messages
+
+    def __init__(self, screen=None):
+        self.screen = screen
+        self.reports = {}
+
+    def read(self, station_ids, start, end, dur_code='D'):
+        'Returns {station_id: (times, values)} of the readings from start through the end date, unscreened, or None if they could not be read'
+        raise NotImplementedError
+
+    def get_name(self, station_id):
+        return station_id
+
+    def _screen(self, station_id, dtv, dur_code):
+        'Converts (dates, values) to daily typed columns, screened, with flags; hourly and event times keep their minutes'
+        if len(dtv[0]) == 0:
+            raise ValueError(f'No {self.source} data available from station_id {station_id}, dur_code {dur_code}')
+        times = np.asarray(dtv[0]).astype('datetime64[D]' if dur_code == 'D' else 'datetime64[m]')
+        values = np.asarray(dtv[1], dtype=np.float64)
+        if self.screen is not None:
+            times, values, flags, self.reports[station_id] = self.screen(station_id, times, values)
+            return times, values, flags
+        if dur_code == 'D':
+            return times, screen(values), None
+        # sub-daily times must increase; repeated times keep their first value
+        keep = np.concatenate(([True], times[1:] > np.maximum.accumulate(times)[:-1]))
+        return times[keep], screen(values[keep]), None
+
+    def fetch(self, station_id, start, end, dur_code='D'):
+        'Reads one station from start through the end date.  Returns (dates, values, flags) arrays, flags None unless screened; or None if it could not be read'
+        series = self.read([station_id], start, end, dur_code)
+        if series is None: return
+        return self._screen(station_id, series[station_id], dur_code)
+
+    @instrument.timed('fetch')
+    def _fetch_data(self, station_id, start, nbr_years, dur_code='D') -> tuple:
+        'Reads one station for nbr_years water years.  Returns (dates, values, flags) arrays; flags are None unless screened'
+        return self.fetch(station_id, start, fetch_end(start, nbr_years), dur_code)
+
+    def fill(self, handler:storagehandler.Handler, starting_date, nbr_years=1, dur_code='D'):
+        'Load 1-day sampled storage at time 00:00, or hourly (H) or event (E) readings'
+        dt, storage, flags = self._fetch_data(handler.station_id, starting_date, nbr_years, dur_code=dur_code)
+        handler._storage = storagehandler.StorageRecord(dt, storage, flags)
+
+    @instrument.timed('fetch')
+    def fill_many(self, handlers, starting_date, nbr_years=1, dur_code='D'):
+        'Load storage for several handlers, reading their stations together'
+        series = self.read([h.station_id for h in handlers], starting_date, fetch_end(starting_date, nbr_years), dur_code)
+        if series is None: return
+        for handler in handlers:
+            dt, storage, flags = self._screen(handler.station_id, series[handler.station_id], dur_code)
+            handler._storage = storagehandler.StorageRecord(dt, storage, flags)
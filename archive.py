@@ -0,0 +1,256 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Local archives of storage time series, and the adapter which reads them into Handlers
+# Series are kept by station and duration code (D daily, H hourly, E event) as arrays:  times in
+# minutes since 1970-01-01 (int64) and values in acre-feet (float64).  Two layouts:
+#   SqliteArchive   one SQLite file; each station's series is stored in blocks of one calendar year,
+#                   as binary columns, so a record of decades is one query returning tens of rows
+#   MemmapArchive   a folder of .npy files, one per station and duration, read memory-mapped; a
+#                   record is one binary search and one slice of the file
+# Neither does Python work per reading.  open_archive(path) picks the layout from the path.
+# Fill an archive from your own database with store(), or from the command line:
+#   python archive.py storage_archive.sqlite --csv readings.csv    (columns station, time, value)
+#   python archive.py archive_folder --cdec-cache cdec_cache.sqlite
+import os, json, sqlite3, threading, argparse
+from datetime import date
+import numpy as np
+from adapters import StorageAdapter
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS series (
+    station TEXT, dur TEXT,
+    year INTEGER,  -- calendar year of the block
+    times BLOB,    -- int64 minutes since 1970-01-01, increasing
+    vals BLOB,     -- float64 acre-feet
+    PRIMARY KEY (station, dur, year)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stations (
+    station TEXT PRIMARY KEY, name TEXT);
+'''
+
+def _minutes(d):
+    return int(np.datetime64(d, 'm').astype(np.int64))
+
+def _year(minutes):
+    # calendar year of minutes since 1970-01-01, for scalars and arrays
+    return np.asarray(minutes, dtype=np.int64).astype('datetime64[m]').astype('datetime64[Y]').astype(np.int64) + 1970
+
+def _bounds(start, end):
+    # [first, stop) minutes covering the start date through the end date
+    return _minutes(np.datetime64(start, 'D')), _minutes(np.datetime64(end, 'D') + np.timedelta64(1, 'D'))
+
+def _merged(old, new):
+    # (t, v) of both, sorted by time; where both have a time, new wins
+    t = np.concatenate((new[0], old[0]))
+    v = np.concatenate((new[1], old[1]))
+    t, first = np.unique(t, return_index=True)
+    return t, v[first]
+
+def _locked(method):
+    def wrapper(self, *args):
+        with self.lock:
+            return method(self, *args)
+    return wrapper
+
+class SqliteArchive:
+    'Series in one SQLite file, in yearly binary blocks'
+
+    def __init__(self, path='storage_archive.sqlite'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.executescript(_SCHEMA)
+
+    @_locked
+    def close(self):
+        self.db.close()
+
+    def _blocks(self, station, dur, first, stop):
+        rows = self.db.execute('SELECT times, vals FROM series WHERE station=? AND dur=? AND year BETWEEN ? AND ? ORDER BY year',
+                               (station, dur, int(_year(first)), int(_year(stop - 1)))).fetchall()
+        return (np.concatenate([np.frombuffer(t, dtype=np.int64) for t, v in rows] or [np.zeros(0, np.int64)]),
+                np.concatenate([np.frombuffer(v, dtype=np.float64) for t, v in rows] or [np.zeros(0)]))
+
+    @_locked
+    def read(self, station, dur, start, end):
+        'Returns (times as datetime64[m], values) from start through the end date'
+        first, stop = _bounds(start, end)
+        t, v = self._blocks(station, dur, first, stop)
+        a, b = np.searchsorted(t, [first, stop])
+        return t[a:b].astype('datetime64[m]'), v[a:b].copy()
+
+    @_locked
+    def store(self, station, dur, times, values):
+        'Merges the readings into the series of station and dur; readings at times already stored replace them'
+        t = np.asarray(times).astype('datetime64[m]').astype(np.int64)
+        if len(t) == 0: return
+        v = np.asarray(values, dtype=np.float64)
+        first, stop = int(t.min()), int(t.max()) + 1
+        t, v = _merged(self._blocks(station, dur, first, stop), (t, v))
+        years = _year(t)
+        cuts = np.flatnonzero(np.diff(years)) + 1
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO series VALUES (?,?,?,?,?)',
+                    ((station, dur, int(y[0]), ti.tobytes(), vi.tobytes())
+                     for y, ti, vi in zip(np.split(years, cuts), np.split(t, cuts), np.split(v, cuts))))
+
+    @_locked
+    def series(self):
+        'The (station, dur) pairs stored'
+        return self.db.execute('SELECT DISTINCT station, dur FROM series ORDER BY station, dur').fetchall()
+
+    @_locked
+    def get_name(self, station):
+        row = self.db.execute('SELECT name FROM stations WHERE station=?', (station,)).fetchone()
+        return row[0] if row else None
+
+    @_locked
+    def set_name(self, station, name):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO stations VALUES (?,?)', (station, name))
+
+class MemmapArchive:
+    'Series as .npy files in one folder, read memory-mapped'
+
+    DTYPE = np.dtype([('t', '<i8'), ('v', '<f8')])
+
+    def __init__(self, path='storage_archive'):
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._mapped = {}
+        self._names = {}
+        if os.path.exists(os.path.join(path, 'names.json')):
+            with open(os.path.join(path, 'names.json')) as f:
+                self._names = json.load(f)
+
+    def close(self):
+        self._mapped.clear()
+
+    def _file(self, station, dur):
+        return os.path.join(self.path, f'{station}_{dur}.npy')
+
+    @_locked
+    def _series(self, station, dur):
+        # the whole series, memory-mapped, or None
+        key = (station, dur)
+        if key not in self._mapped:
+            path = self._file(station, dur)
+            self._mapped[key] = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        return self._mapped[key]
+
+    def read(self, station, dur, start, end):
+        'Returns (times as datetime64[m], values) from start through the end date'
+        series = self._series(station, dur)
+        if series is None: return np.zeros(0, dtype='datetime64[m]'), np.zeros(0)
+        first, stop = _bounds(start, end)
+        a, b = np.searchsorted(series['t'], [first, stop])
+        block = np.array(series[a:b])
+        return block['t'].astype('datetime64[m]'), block['v']
+
+    @_locked
+    def store(self, station, dur, times, values):
+        'Merges the readings into the series of station and dur; readings at times already stored replace them'
+        t = np.asarray(times).astype('datetime64[m]').astype(np.int64)
+        if len(t) == 0: return
+        old = self._series(station, dur)
+        old = (np.zeros(0, np.int64), np.zeros(0)) if old is None else (np.array(old['t']), np.array(old['v']))
+        t, v = _merged(old, (t, np.asarray(values, dtype=np.float64)))
+        series = np.empty(len(t), dtype=self.DTYPE)
+        series['t'], series['v'] = t, v
+        self._mapped.pop((station, dur), None)
+        path = self._file(station, dur)
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, series, allow_pickle=False)
+        os.replace(path + '.tmp', path)
+
+    def series(self):
+        'The (station, dur) pairs stored'
+        return sorted(tuple(name[:-4].rsplit('_', 1)) for name in os.listdir(self.path) if name.endswith('.npy'))
+
+    def get_name(self, station):
+        return self._names.get(station)
+
+    @_locked
+    def set_name(self, station, name):
+        self._names[station] = name
+        with open(os.path.join(self.path, 'names.json'), 'w') as f:
+            json.dump(self._names, f, indent=1)
+
+def open_archive(path):
+    'A SqliteArchive for a file path ending .sqlite or .db, or an existing file; otherwise a MemmapArchive folder'
+    if str(path).endswith(('.sqlite', '.db')) or os.path.isfile(path):
+        return SqliteArchive(path)
+    return MemmapArchive(path)
+
+class ArchiveAdapter(StorageAdapter):
+    'Reads storage from a local archive; see StorageAdapter for screen'
+    source = 'archive'
+
+    def __init__(self, archive, screen=None):
+        super().__init__(screen)
+        self.archive = open_archive(archive) if isinstance(archive, (str, os.PathLike)) else archive
+
+    def read(self, station_ids, start, end, dur_code='D'):
+        'Returns {station_id: (times, values)} from start through the end date; empty for stations not archived'
+        return {station_id: self.archive.read(station_id, dur_code, start, end) for station_id in station_ids}
+
+    def get_name(self, station_id):
+        return self.archive.get_name(station_id) or station_id
+
+    def close(self):
+        self.archive.close()
+
+def load_csv(archive, f, dur='D'):
+    'Stores the readings of a CSV file with a header row and the columns station, time, value.  Returns the number stored'
+    rows = np.loadtxt(f, delimiter=',', dtype=str, skiprows=1, ndmin=2)
+    if len(rows) == 0: return 0
+    stations = np.char.upper(np.char.strip(rows[:, 0]))
+    times = np.char.replace(np.char.strip(rows[:, 1]), ' ', 'T').astype('datetime64[m]')
+    values = rows[:, 2].astype(np.float64)
+    order = np.argsort(stations, kind='stable')
+    stations, times, values = stations[order], times[order], values[order]
+    cuts = np.flatnonzero(stations[1:] != stations[:-1]) + 1
+    for s, t, v in zip(np.split(stations, cuts), np.split(times, cuts), np.split(values, cuts)):
+        archive.store(str(s[0]), dur, t, v)
+    return len(rows)
+
+def copy_cache(archive, cache_path, sensor_num=15):
+    'Stores the readings of sensor_num, and the station names, kept in a cdeccache.CdecCache file.  Returns the number stored'
+    db = sqlite3.connect(cache_path, timeout=30)
+    total = 0
+    for station, dur in db.execute('SELECT DISTINCT station, dur FROM obs WHERE sensor=?', (sensor_num,)).fetchall():
+        rows = np.array(db.execute('SELECT t, value FROM obs WHERE station=? AND sensor=? AND dur=? ORDER BY t',
+                                   (station, sensor_num, dur)).fetchall(), dtype=np.float64).reshape(-1, 2)
+        archive.store(station, dur, rows[:, 0].astype(np.int64).astype('datetime64[m]'), rows[:, 1])
+        total += len(rows)
+    for station, name in db.execute('SELECT station, name FROM stations').fetchall():
+        archive.set_name(station, name)
+    db.close()
+    return total
+
+# Main program
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill a local archive of storage time series, and list what it holds')
+    parser.add_argument('archive', help='SQLite file (.sqlite or .db), or a folder of memory-mapped series')
+    parser.add_argument('--csv', metavar='FILE', help='store the readings of a CSV file:  station, time, value')
+    parser.add_argument('--duration', choices=('D', 'H', 'E'), default='D', help='duration code of the CSV readings (default D)')
+    parser.add_argument('--cdec-cache', metavar='FILE', help='store the storage readings kept in a CDEC cache file')
+    args = parser.parse_args()
+
+    archive = open_archive(args.archive)
+    if args.csv:
+        with open(args.csv, newline='') as f:
+            print(f'{load_csv(archive, f, args.duration)} readings stored from {args.csv}')
+    if args.cdec_cache:
+        print(f'{copy_cache(archive, args.cdec_cache)} readings stored from {args.cdec_cache}')
+    for station, dur in archive.series():
+        t, v = archive.read(station, dur, date(1800, 1, 1), date(2200, 1, 1))
+        print(f'{station:6s} {dur}  {len(t):8d} readings  {t[0] if len(t) else ""} to {t[-1] if len(t) else ""}  {archive.get_name(station) or ""}')
+    archive.close()
@@ -0,0 +1,129 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Storage analyses for many reservoirs and water years in one run
+# The manifest is a CSV file with a header row and the columns
+#   station, wateryear, handle_init, volume_limit
+# handle_init (true/false) and volume_limit (acre-feet) may be left blank for their defaults.
+# A station and water year may be listed more than once with different settings; the output
+# files of those rows are then named with their settings, so they do not overwrite each other.
+# Each row is fetched, computed, plotted, and written on a pool of worker processes.
+import sys, os, csv, argparse
+from collections import Counter
+os.environ.setdefault('MPLBACKEND', 'Agg')  # headless; no display needed
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from one_res_one_wy_cdec import one_res
+import exporters, instrument
+
+PHASES = ('fetch', 'compute', 'plot', 'write')
+
+def read_manifest(f):
+    'Returns a list of dicts with station, wateryear, handle_init, volume_limit, and label for the output file names'
+    rows = []
+    for row in csv.DictReader(line for line in f if line.strip() and not line.startswith('#')):
+        handle_init = (row.get('handle_init') or 'true').strip().lower()
+        rows.append({
+            'station': row['station'].strip().upper(),
+            'wateryear': int(row['wateryear']),
+            'handle_init': handle_init not in ('false', 'no', 'n', '0'),
+            'volume_limit': float(row.get('volume_limit') or 0),
+            })
+    runs = Counter((row['station'], row['wateryear']) for row in rows)
+    settings = Counter((row['station'], row['wateryear'], row['handle_init'], row['volume_limit']) for row in rows)
+    for row in rows:
+        if settings[row['station'], row['wateryear'], row['handle_init'], row['volume_limit']] > 1:
+            raise ValueError(f"{row['station']} {row['wateryear']} is listed more than once with the same settings")
+        multiple = runs[row['station'], row['wateryear']] > 1
+        row['label'] = f" init {str(row['handle_init']).lower()} limit {row['volume_limit']:g}" if multiple else ''
+    return rows
+
+def run_row(row, output_dir, nbr_years=1, cache=None, offline=False, plot=True, plot_format='svg', daily_format='json', result_cache=None,
+            profile=False, screen=False, archive=None):
+    'Worker: complete analysis of one manifest row.  Returns (row, timings, error message or None, profile dict or None)'
+    # With profile=True the row is run with instrument enabled
+    timings = {}
+    if profile: instrument.enable()
+    try:
+        handler, plotter, monthlies = one_res(row['station'], row['wateryear'], initialcoll=row['handle_init'],
+                output_dir=output_dir, nbr_years=nbr_years, volume_limit=row['volume_limit'], timings=timings,
+                cache=cache, offline=offline, plot=plot, plot_format=plot_format, daily_format=daily_format, result_cache=result_cache,
+                screen=screen, archive=archive, label=row.get('label', ''))
+        if plotter is not None: plotter.close()
+    except Exception as e:
+        return row, timings, f'{type(e).__name__}: {e}', _collected()
+    return row, timings, None, _collected()
+
+def _collected():
+    profile = instrument.disable()
+    return None if profile is None else profile.as_dict()
+
+def run_batch(rows, output_dir, workers=None, nbr_years=1, cache=None, offline=False, plot=True, plot_format='svg', daily_format='json', result_cache=None,
+              profile=False, screen=False, archive=None):
+    'Runs every row on a process pool.  Returns the list of run_row results, in manifest order'
+    results = [None] * len(rows)
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_row, row, output_dir, nbr_years, cache, offline, plot, plot_format, daily_format, result_cache, profile, screen, archive): i for i, row in enumerate(rows)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+def report(results, elapsed, f=sys.stdout):
+    'Prints failures, then total and slowest seconds per phase summed across workers'
+    failed = [(row, err) for row, timings, err, profile in results if err]
+    for row, err in failed:
+        f.write(f"FAILED {row['station']} {row['wateryear']}{row.get('label', '')}: {err}\n")
+    f.write(f'{len(results)-len(failed)} of {len(results)} analyses completed in {elapsed:.1f} s\n')
+    f.write(f"{'Phase':8s} {'Total':>8s}{'Max':>8s}\n")
+    for phase in PHASES:
+        t = [timings.get(phase, 0) for row, timings, err, profile in results]
+        if t: f.write(f'{phase:8s} {sum(t):8.2f}{max(t):8.2f}\n')
+
+def merged_profile(results):
+    'The profiles of all rows added together, or None if not profiled'
+    profiles = [profile for row, timings, err, profile in results if profile is not None]
+    if not profiles: return None
+    total = instrument.Profile()
+    for profile in profiles: total.merge(profile)
+    return total
+
+# Main program
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='30-day storage analysis of every reservoir and water year in a manifest')
+    parser.add_argument('manifest', help='CSV file:  station, wateryear, handle_init, volume_limit')
+    parser.add_argument('output_dir', help='folder for the text, JSON, and SVG outputs')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--years', type=int, default=1, help='water years per analysis')
+    parser.add_argument('--daily-format', choices=('json',) + exporters.FORMATS, default='json', help='format of the daily values')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite file to keep CDEC data between runs')
+    parser.add_argument('--offline', action='store_true', help='use only data already in the cache')
+    parser.add_argument('--result-cache', metavar='PATH', help='SQLite file to reuse results of unchanged data')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON', help='print time per phase and counters, summed over rows; optionally save them as JSON')
+    parser.add_argument('--archive', metavar='PATH', help='read storage from this local archive (see archive.py) instead of CDEC')
+    parser.add_argument('--screen', action='store_true', help='screen the readings for gaps, spikes, and flatlines; saves a quality report per row')
+    parser.add_argument('--no-plot', action='store_true', help='text and JSON outputs only')
+    parser.add_argument('--format', choices=('svg', 'png'), default='svg', help='plot file format; png is faster to write')
+    args = parser.parse_args()
+
+    with open(args.manifest, newline='') as f:
+        rows = read_manifest(f)
+    start = perf_counter()
+    results = run_batch(rows, args.output_dir, workers=args.workers, nbr_years=args.years,
+                        cache=args.cache, offline=args.offline,
+                        plot=not args.no_plot, plot_format=args.format, daily_format=args.daily_format,
+                        result_cache=args.result_cache, profile=args.profile is not None, screen=args.screen,
+                        archive=args.archive)
+    report(results, perf_counter() - start)
+    profile = merged_profile(results)
+    if profile is not None:
+        profile.report()
+        if args.profile:
+            with open(args.profile, 'w') as f:
+                profile.write_json(f)
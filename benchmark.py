@@ -0,0 +1,193 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Benchmarks of each phase on synthetic records, without network access
+# Every kind of record in synthetic.py, at each length, is timed through
+#   parse     parse_servlet_json on a canned servlet response
+#   fetch     CdecDailyResAdapter._fetch_data from a local stand-in servlet
+#   screen    screening.Screen with its default steps
+#   compute   set_beginnings and compute_deltaS, drawdown='sampled'
+#   exact     the same, drawdown='exact'
+#   monthly   Monthlies
+#   plot      Plotter.make_plot and writing SVG (records of up to 10 years)
+# Each is timed as the best of several runs, then run once more to record its peak memory.
+# Times and peaks are compared with a saved baseline, and the faster code paths are checked
+# against the reference ones, which must agree exactly.  Exits with status 1 on a regression or
+# a mismatch.
+import sys, os, io, json, argparse, tracemalloc
+os.environ.setdefault('MPLBACKEND', 'Agg')  # headless; no display needed
+from time import perf_counter
+from datetime import date
+import numpy as np
+import cdecpuller, screening, synthetic
+from storagehandler import Handler, StorageRecord, Monthlies, Plotter, _CrossingIndex
+
+PLOT_YEARS = 10  # longest record plotted
+
+def _measure(run, repeat):
+    # best time of repeat runs, then the peak memory of one more
+    best = min(_time(run) for _ in range(repeat))
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak}
+
+def _time(run):
+    start = perf_counter()
+    run()
+    return perf_counter() - start
+
+def _handler(record, drawdown='sampled'):
+    handler = Handler('SYN', drawdown=drawdown)
+    handler._storage = StorageRecord(*record)
+    handler.set_beginnings()
+    return handler
+
+def _computed(record, drawdown='sampled'):
+    handler = _handler(record, drawdown)
+    handler.compute_deltaS()
+    return handler
+
+def _plot(handler):
+    plotter = Plotter(handler, 'Synthetic', 'SYN', handler.endyear())
+    plotter.make_plot()
+    plotter.fig.savefig(io.BytesIO(), format='svg')
+    plotter.close()
+
+def _fetch(url, years):
+    cdecpuller.CDEC_URL = url
+    return cdecpuller.CdecDailyResAdapter()._fetch_data('SYN', date(1990, 9, 1), years)
+
+def run_benchmarks(years=(1, 10, 100), kinds=synthetic.KINDS, repeat=3, plot=True):
+    'Returns {"phase/kind/Ny": {"seconds": best time, "peak_bytes": peak traced memory}}'
+    results = {}
+    for kind in kinds:
+        for n in years:
+            record = synthetic.storage_series(n, kind, seed=n)
+            name = f'{kind}/{n}y'
+            canned = synthetic.servlet_json('SYN', *record)
+            results[f'parse/{name}'] = _measure(lambda: cdecpuller.parse_servlet_json(
+                    (canned[i:i + (1 << 20)] for i in range(0, len(canned), 1 << 20)), ['SYN']), repeat)
+            with synthetic.ServletStandIn({'SYN': record}) as stand_in:
+                results[f'fetch/{name}'] = _measure(lambda: _fetch(stand_in.url, n), repeat)
+            results[f'screen/{name}'] = _measure(lambda: screening.Screen()('SYN', *record), repeat)
+            results[f'compute/{name}'] = _measure(lambda: _computed(record), repeat)
+            results[f'exact/{name}'] = _measure(lambda: _computed(record, 'exact'), repeat)
+            handler = _computed(record)
+            results[f'monthly/{name}'] = _measure(lambda: Monthlies(handler), repeat)
+            if plot and n <= PLOT_YEARS:
+                results[f'plot/{name}'] = _measure(lambda: _plot(handler), repeat)
+    return results
+
+def check_record(record):
+    'Compares the faster code paths with the reference ones on one record.  Returns a list of mismatches'
+    failed = []
+    handler = _computed(record)
+    ts = handler._storage.storage
+    w = handler.window
+
+    # rolling minimums against slicing
+    ahead, behind = handler.rolling_minimums()
+    for ind in range(len(ts)):
+        if ahead[ind] != min(ts[ind+1:ind+w+1], default=np.inf) or (ind > 0 and behind[ind] != ts[max(0, ind-(w-1)):ind].min()):
+            failed.append(f'rolling minimums differ on day {ind}')
+            break
+
+    # crossing index against the _hit_once scan, a week apart through the record
+    crossings, beginning = _CrossingIndex(), 0
+    for ind in range(1, len(ts) - 1):
+        crossings.add(ts[ind-1], ts[ind])
+        if handler._storage.flags[ind] & 4:
+            crossings.clear()
+            beginning = ind
+        if ind % 7: continue
+        for st in np.linspace(ts[ind], ts[ind+1], 5).tolist() + [float(ts[beginning])]:
+            if (crossings.count(st) <= 1) != handler._hit_once(beginning, ind, st):
+                failed.append(f'crossing index differs from _hit_once on day {ind} at {st}')
+                break
+
+    # seasons computed in parallel, and days appended a few at a time, against one full computation
+    parallel = _handler(record)
+    parallel.compute_deltaS(workers=2)
+    if not np.array_equal(parallel.cwr.values, handler.cwr.values):
+        failed.append('compute_deltaS(workers=2) differs')
+    dates, storage = record
+    first = max(w + 2, len(dates) - 90)
+    appended = _handler((dates[:first], storage[:first]))
+    appended.compute_deltaS(provisional=True)
+    for i in range(first, len(dates), 7):
+        appended.append(dates[i:i+7], storage[i:i+7])
+    done = appended._season.next
+    if not np.array_equal(appended.cwr.values[:, :done], handler.cwr.values[:, :done]):
+        failed.append('append differs')
+
+    # the stand-in servlet round trip against the record itself
+    with synthetic.ServletStandIn({'SYN': record}) as stand_in:
+        fetched = _fetch(stand_in.url, (len(dates) - 62) // 365 + 1)
+    if not (np.array_equal(fetched[0], dates) and np.array_equal(fetched[1], storage)):
+        failed.append('fetched record differs')
+    return failed
+
+def check(years=(1, 10), kinds=synthetic.KINDS):
+    'Runs check_record on each kind of record.  Returns {"kind/Ny": [mismatches]}'
+    return {f'{kind}/{n}y': check_record(synthetic.storage_series(n, kind, seed=n)) for kind in kinds for n in years}
+
+def compare(results, baseline, tolerance=0.25, noise=0.005):
+    'Returns the names whose time or peak memory exceeds the baseline by more than tolerance'
+    # differences of under noise seconds are not counted
+    slower = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None: continue
+        if result['seconds'] > base['seconds'] * (1 + tolerance) and result['seconds'] - base['seconds'] > noise \
+                or result['peak_bytes'] > base['peak_bytes'] * (1 + tolerance):
+            slower.append(name)
+    return slower
+
+def report(results, baseline, slower, mismatches, f=sys.stdout):
+    'Prints the time and peak memory of each benchmark beside the baseline, then any mismatches'
+    f.write(f"{'Benchmark':28s}{'Seconds':>10s}{'Baseline':>10s}{'Peak MB':>10s}{'Baseline':>10s}\n")
+    for name, result in results.items():
+        base = baseline.get(name, {})
+        f.write(f"{name:28s}{result['seconds']:10.4f}{base.get('seconds', float('nan')):10.4f}"
+                f"{result['peak_bytes']/2**20:10.2f}{base.get('peak_bytes', float('nan'))/2**20:10.2f}"
+                f"{'  SLOWER' if name in slower else ''}\n")
+    for record, failed in mismatches.items():
+        for message in failed:
+            f.write(f'MISMATCH {record}: {message}\n')
+    f.write(f'{len(slower)} regressions, {sum(map(len, mismatches.values()))} mismatches\n')
+
+# Main program
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of Mork30 on synthetic records')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 10, 100], help='record lengths, water years')
+    parser.add_argument('--kinds', nargs='+', choices=synthetic.KINDS, default=list(synthetic.KINDS), help='kinds of record')
+    parser.add_argument('--repeat', type=int, default=3, help='runs timed per benchmark; the best is kept')
+    parser.add_argument('--no-plot', action='store_true', help='skip the plotting benchmarks')
+    parser.add_argument('--no-check', action='store_true', help='skip comparing the fast code paths with the reference ones')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='saved results to compare with')
+    parser.add_argument('--save', action='store_true', help='save these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown or memory growth, as a fraction')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.years, args.kinds, args.repeat, plot=not args.no_plot)
+    mismatches = {} if args.no_check else check([n for n in args.years if n <= PLOT_YEARS] or args.years[:1], args.kinds)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    slower = compare(results, baseline, args.tolerance)
+    report(results, baseline, slower, mismatches)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+    sys.exit(1 if slower or any(mismatches.values()) else 0)
@@ -0,0 +1,112 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Local cache of CDEC observations and station names, kept in one SQLite file
+# Besides the observations, the cache remembers which date ranges have already been requested
+# for each station, sensor, and duration, so a later request only fetches what is missing.
+# Ranges reaching today or later are recorded only through yesterday, since CDEC is still
+# filling those in.  One cache may be shared among threads.
+import sqlite3, threading
+from datetime import date, timedelta
+import numpy as np
+import instrument
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS obs (
+    station TEXT, sensor INTEGER, dur TEXT,
+    t INTEGER,  -- minutes since 1970-01-01
+    value REAL,
+    PRIMARY KEY (station, sensor, dur, t)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    station TEXT, sensor INTEGER, dur TEXT,
+    first INTEGER, last INTEGER);  -- inclusive, days since 1970-01-01
+CREATE TABLE IF NOT EXISTS stations (
+    station TEXT PRIMARY KEY, name TEXT);
+'''
+
+def _locked(method):
+    def wrapper(self, *args):
+        with self.lock:
+            return method(self, *args)
+    return wrapper
+
+def _day(d):
+    return int(np.datetime64(d, 'D').astype(np.int64))
+
+def _date(day):
+    return date(1970, 1, 1) + timedelta(days=day)
+
+class CdecCache:
+    'On-disk cache of CDEC time series with range-aware merging'
+
+    def __init__(self, path='cdec_cache.sqlite'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.executescript(_SCHEMA)
+
+    @_locked
+    def close(self):
+        self.db.close()
+
+    def _covered(self, key):
+        return self.db.execute('SELECT first, last FROM coverage WHERE station=? AND sensor=? AND dur=? ORDER BY first', key).fetchall()
+
+    @_locked
+    def missing(self, station, sensor, dur, start, end):
+        'Returns the (start, end) date ranges, inclusive, within start..end not yet in the cache'
+        gaps = []
+        first, last = _day(start), _day(end)
+        for a, b in self._covered((station, sensor, dur)):
+            if b < first: continue
+            if a > last: break
+            if a > first: gaps.append((_date(first), _date(a-1)))
+            first = max(first, b+1)
+        if first <= last: gaps.append((_date(first), _date(last)))
+        return gaps
+
+    @instrument.timed('cache store')
+    @_locked
+    def store(self, station, sensor, dur, start, end, times, values):
+        'Merges observations fetched for the date range start..end into the cache'
+        key = (station, sensor, dur)
+        t = np.asarray(times, dtype='datetime64[m]').astype(np.int64).tolist()
+        v = np.asarray(values, dtype=np.float64).tolist()
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO obs VALUES (?,?,?,?,?)', ((*key, ti, vi) for ti, vi in zip(t, v)))
+            last = min(_day(end), _day(date.today()) - 1)
+            if last < _day(start): return
+            # union the new range with what is already covered, merging overlapping or adjacent ranges
+            merged = []
+            for a, b in sorted(self._covered(key) + [(_day(start), last)]):
+                if merged and a <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], b)
+                else:
+                    merged.append([a, b])
+            self.db.execute('DELETE FROM coverage WHERE station=? AND sensor=? AND dur=?', key)
+            self.db.executemany('INSERT INTO coverage VALUES (?,?,?,?,?)', ((*key, a, b) for a, b in merged))
+
+    @instrument.timed('cache load')
+    @_locked
+    def load(self, station, sensor, dur, start, end):
+        'Returns (times as datetime64[m], values) for observations from start through the end date'
+        rows = self.db.execute('SELECT t, value FROM obs WHERE station=? AND sensor=? AND dur=? AND t>=? AND t<? ORDER BY t',
+                               (station, sensor, dur, _day(start)*1440, (_day(end)+1)*1440)).fetchall()
+        a = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return a[:,0].astype(np.int64).astype('datetime64[m]'), a[:,1]
+
+    @_locked
+    def get_name(self, station):
+        row = self.db.execute('SELECT name FROM stations WHERE station=?', (station,)).fetchone()
+        return row[0] if row else None
+
+    @_locked
+    def set_name(self, station, name):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO stations VALUES (?,?)', (station, name))
@@ -7,26 +7,102 @@
 ## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
 ## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
 
-import storagehandler
-import requests, json
-from datetime import date, timedelta, datetime
-from bs4 import BeautifulSoup
+import instrument
+import requests, re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 import numpy as np
+from adapters import StorageAdapter, screen
 
-def get_daily_station_info(station_id):
-    r = requests.get(f'https://cdec.water.ca.gov/dynamicapp/QueryDaily?s={station_id}')
-    r.raise_for_status()
+# Point this elsewhere, for example a local stand-in server, for testing
+CDEC_URL = 'https://cdec.water.ca.gov'
+TIMEOUT = 60  # seconds
+
+_session = None
+
+def session() -> requests.Session:
+    'The shared, connection-pooled HTTP session; retries failed requests with exponential backoff'
+    global _session
+    if _session is None:
+        retry = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=retry)
+        _session = requests.Session()
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def _servlet_url(station_id, sensor_num, dur_code, start, end):
+    return f'{CDEC_URL}/dynamicapp/req/JSONDataServlet?Stations={station_id}&SensorNums={sensor_num}&dur_code={dur_code}&Start={start.isoformat()}&End={end.isoformat()}'
+
+# Each servlet row is a flat JSON object such as
+#   {"stationId":"ORO","durCode":"D","SENSOR_NUM":15,"sensorType":"STORAGE","date":"2021-10-01 00:00",
+#    "obsDate":"2021-10-01 00:00","value":1234567,"dataFlag":" ","units":"AF"}
+# so the fields we need can be picked out of the raw bytes without building Python objects per row
+_STATION = re.compile(rb'"stationId"\s*:\s*"([^"]*)"')
+_DATE = re.compile(rb'"date"\s*:\s*"([^"]*)"')
+_VALUE = re.compile(rb'"value"\s*:\s*([^,}\s]+)')
+
+def _parse_rows(block, station_ids, parts):
+    # appends the (dates, values) of each station in the complete rows of block to parts
+    dates, values = _DATE.findall(block), _VALUE.findall(block)
+    if len(dates) == 0: return
+    stations = _STATION.findall(block) or [station_ids[0].encode()] * len(dates)
+    if not len(stations) == len(dates) == len(values):
+        raise ValueError('Unexpected format in CDEC response')
+    dates = np.array(dates).astype('datetime64[m]')
+    values = np.array(values)
+    values[values == b'null'] = b'nan'
+    values = values.astype(np.float64)
+    stations = np.array(stations)
+    for station_id in parts:
+        mine = stations == station_id.encode()
+        parts[station_id].append((dates[mine], values[mine]))
+    instrument.count('rows parsed', len(dates))
+
+def parse_servlet_json(chunks, station_ids):
+    'Parses a servlet response, as an iterable of bytes chunks, into {station_id: (datetime64[m] array, float64 array)}'
+    parts = {station_id: [] for station_id in station_ids}
+    tail = b''
+    for chunk in chunks:
+        # parse the complete rows received so far, and carry the partial row over to the next chunk
+        block = tail + chunk
+        cut = block.rfind(b'}') + 1
+        block, tail = block[:cut], block[cut:]
+        with instrument.timer('json parse'):
+            _parse_rows(block, station_ids, parts)
+    return {station_id: (np.concatenate([d for d, v in p] or [np.array([], dtype='datetime64[m]')]),
+                         np.concatenate([v for d, v in p] or [np.array([])])) for station_id, p in parts.items()}
+
+def get_daily_station_info(station_id, cache=None, offline=False):
+    # With a cache (cdeccache.CdecCache) the name is looked up once and remembered
+    if cache is not None:
+        station_name = cache.get_name(station_id)
+        if station_name is not None: return station_name
+        if offline: return station_id
+    from bs4 import BeautifulSoup
+    with instrument.timer('station name'):
+        r = session().get(f'{CDEC_URL}/dynamicapp/QueryDaily?s={station_id}', timeout=TIMEOUT)
+        r.raise_for_status()
+    instrument.count('http requests')
+    instrument.count('http bytes', len(r.content))
     soup = BeautifulSoup(r.text, 'html.parser')
     t = soup.find('title')
     station_name = t.string[:t.string.find('(') - 1] #remove the parentheses and station id
+    if cache is not None: cache.set_name(station_id, station_name.title())
     return station_name.title()
 
-def confirm_ok(station_id, sensor_num=15, dur_code='D') -> bool:
+def confirm_ok(station_id, sensor_num=15, dur_code='D', cache=None, offline=False) -> bool:
     'Fetches JSON formatted data...just one...to validate the station_id, sensor_num, and dur_code'
+    # A station already in the cache was valid when it was fetched
+    if cache is not None:
+        if cache.get_name(station_id) is not None: return True
+        if offline: return False
     start = end = date.today()
-    url = f'https://cdec.water.ca.gov/dynamicapp/req/JSONDataServlet?Stations={station_id}&SensorNums={sensor_num}&dur_code={dur_code}&Start={start.isoformat()}&End={end.isoformat()}'
+    url = _servlet_url(station_id, sensor_num, dur_code, start, end)
     try:
-        response = requests.get(url)
+        response = session().get(url, timeout=TIMEOUT)
         response.raise_for_status()
         jtext = response.json()
     except requests.exceptions.RequestException as e:
@@ -34,46 +110,101 @@ def confirm_ok(station_id, sensor_num=15, dur_code='D') -> bool:
         return
     return len(jtext) != 0
 
-class CdecDailyResAdapter:
+def _counted(chunks):
+    instrument.count('http requests')
+    for chunk in chunks:
+        instrument.count('http bytes', len(chunk))
+        yield chunk
+
+class CdecDailyResAdapter(StorageAdapter):
     "Very basic interface to CDEC's JSON data servlet, to retrieve daily reservoir contents time series"
-    def __init__(self, debug=False):
+    # Pass a cdeccache.CdecCache to keep what is fetched on disk and request only date ranges not
+    # already cached; with offline=True the network is never used and only cached data is returned.
+    # Long date ranges are requested in pieces of chunk_days, and up to stations_per_request stations
+    # share one request; the pieces are fetched concurrently on max_workers threads.
+    # screen is passed on to StorageAdapter.  Readings are of sensor_num, 15 being reservoir storage.
+    # With debug=True each response is also saved as debug_<stations>_<start>_<end>.json.
+    source = 'CDEC'
+    sensor_num = 15
+
+    def __init__(self, debug=False, cache=None, offline=False, chunk_days=366, stations_per_request=10, max_workers=8, screen=None):
+        super().__init__(screen)
         self.debug = debug
+        self.cache = cache
+        self.offline = offline
+        self.chunk_days = chunk_days
+        self.stations_per_request = stations_per_request
+        self.max_workers = max_workers
 
-    def _fetch_data(self, station_id, start, nbr_years, sensor_num=15, dur_code='D') -> dict:
-        'Fetches JSON formatted time series from CDEC'
-        end = start + timedelta(366 * nbr_years + 62)
-        self.url = f'https://cdec.water.ca.gov/dynamicapp/req/JSONDataServlet?Stations={station_id}&SensorNums={sensor_num}&dur_code={dur_code}&Start={start.isoformat()}&End={end.isoformat()}'
+    @instrument.timed('cdec request')
+    def _download(self, station_ids, start, end, sensor_num, dur_code):
+        'One servlet request.  Returns {station_id: (dates, values)} arrays, unscreened, or None if the request failed'
+        self.url = _servlet_url(','.join(station_ids), sensor_num, dur_code, start, end)
         try:
-            response = requests.get(self.url)
-            response.raise_for_status()
-            jtext = response.json()
+            # the response is parsed as it streams in, rather than held whole
+            with session().get(self.url, timeout=TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                chunks = response.iter_content(chunk_size=1 << 20)
+                if self.debug:
+                    chunks = self._debug_copy(chunks, f"debug_{'_'.join(station_ids)}_{start}_{end}.json")
+                if instrument.active is not None:
+                    chunks = _counted(chunks)
+                return parse_servlet_json(chunks, station_ids)
         except requests.exceptions.RequestException as e:
             print(f'Attempt to pull CDEC data failed: {e}')
             return
-        if len(jtext) == 0:
-            raise ValueError(f'No CDEC data available from station_id {station_id}, sensor_num {sensor_num}, dur_code {dur_code}')
-        ts = []
-        previous_obs_value = -1
-        if self.debug:
-                with open('debug.json', 'w', encoding='utf-8') as debug_out:
-                    json.dump(jtext, debug_out, ensure_ascii=False, indent=2)
-        for row in jtext:
-            obs_date = np.datetime64(datetime.strptime(row['date'], "%Y-%m-%d %H:%M").date())
-            obs_value = float(row['value'])
-
-            # Following section does rudimetary bad-data screening, needs work!
-            if previous_obs_value < 0: previous_obs_value = obs_value
-            if obs_value < 0: obs_value = previous_obs_value
-
-            ts.append([obs_date, obs_value])
-            previous_obs_value = obs_value
-        return np.array(ts)
-
-    def fill(self, handler:storagehandler.Handler, starting_date, nbr_years=1):
-        'Load 1-day sampled storage at time 00:00 data from CDEC'
-
-        dtst = self._fetch_data(handler.station_id, starting_date, nbr_years)
-        storage = dtst[:,1]
-        dt = dtst[:,0]
-        flags = np.zeros(len(dt), dtype=np.int8)
-        handler._storage = np.array([dt, storage, flags])
\ No newline at end of file
+
+    def _debug_copy(self, chunks, path):
+        with open(path, 'wb') as debug_out:
+            for chunk in chunks:
+                debug_out.write(chunk)
+                yield chunk
+
+    def _download_ranges(self, wanted, sensor_num, dur_code):
+        'Fetches {(start, end): [station_ids]} concurrently.  Returns a list of (station_ids, start, end, result)'
+        pieces = []
+        for (start, end), station_ids in wanted.items():
+            for i in range(0, len(station_ids), self.stations_per_request):
+                a = start
+                while a <= end:
+                    b = min(end, a + timedelta(self.chunk_days - 1))
+                    pieces.append((station_ids[i:i+self.stations_per_request], a, b))
+                    a = b + timedelta(1)
+        # with debug, one request at a time, so self.url is the one whose response is being read
+        with ThreadPoolExecutor(max_workers=1 if self.debug else self.max_workers) as pool:
+            results = pool.map(lambda p: self._download(*p, sensor_num, dur_code), pieces)
+            return [(*p, r) for p, r in zip(pieces, results)]
+
+    def _fetch_many(self, station_ids, start, end, sensor_num, dur_code):
+        'Returns {station_id: (dates, values)}, unscreened, or None if a request failed'
+        if self.cache is None:
+            pieces = {station_id: [] for station_id in station_ids}
+            for group, a, b, result in self._download_ranges({(start, end): list(station_ids)}, sensor_num, dur_code):
+                if result is None: return
+                for station_id in group:
+                    pieces[station_id].append(result[station_id])
+            return {station_id: (np.concatenate([d for d, v in p]), np.concatenate([v for d, v in p]))
+                    for station_id, p in pieces.items()}
+        if not self.offline:
+            # stations missing the same date range are requested together; the ranges which did
+            # arrive are cached even if another failed, but a record with a hole is not returned
+            wanted = {}
+            for station_id in station_ids:
+                for a, b in self.cache.missing(station_id, sensor_num, dur_code, start, end):
+                    wanted.setdefault((a, b), []).append(station_id)
+            failed = False
+            for group, a, b, result in self._download_ranges(wanted, sensor_num, dur_code):
+                if result is None:
+                    failed = True
+                    continue
+                for station_id in group:
+                    self.cache.store(station_id, sensor_num, dur_code, a, b, *result[station_id])
+            if failed: return
+        return {station_id: self.cache.load(station_id, sensor_num, dur_code, start, end) for station_id in station_ids}
+
+    def read(self, station_ids, start, end, dur_code='D'):
+        'Returns {station_id: (dates, values)}, unscreened, or None if a request failed'
+        return self._fetch_many(station_ids, start, end, self.sensor_num, dur_code)
+
+    def get_name(self, station_id):
+        return get_daily_station_info(station_id, cache=self.cache, offline=self.offline)
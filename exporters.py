@@ -0,0 +1,121 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Writers for daily results (Handler.daily()) and period totals (Monthlies) in bulk formats
+#   'jsonl'  one JSON object per line, written in blocks as it is formatted
+#   'csv'    header row plus one line per day or period
+#   'npy'    NumPy structured array; read back with read_table(), memory-mapped, without parsing
+# Daily rows carry the same date, coll, wd, and reg values as Handler.store_daily_json.
+# Period rows carry start, end, collection, withdrawal, and regulation.
+# Text formats are built a block of rows at a time with vectorized string operations.
+import json
+import numpy as np
+
+FORMATS = ('jsonl', 'csv', 'npy')
+BLOCK = 8192  # rows formatted at a time
+
+def daily_table(handler):
+    'Daily results as a structured array with fields date, coll, wd, reg (acre-feet, 2 decimals)'
+    cwr = handler.daily()
+    table = np.empty(len(cwr[0]), dtype=[('date', 'datetime64[D]'), ('coll', 'f8'), ('wd', 'f8'), ('reg', 'f8')])
+    table['date'] = cwr[0]
+    # adding zero turns -0.0 into 0.0
+    table['coll'] = np.round(cwr[1] + cwr[4], 2) + 0.0
+    table['wd'] = np.round(-(cwr[2] + cwr[5]), 2) + 0.0
+    table['reg'] = np.round(cwr[3], 2) + 0.0
+    return table
+
+def period_table(monthlies):
+    'Period totals as a structured array with fields start, end, collection, withdrawal, regulation'
+    table = np.empty(len(monthlies.start), dtype=[('start', 'datetime64[D]'), ('end', 'datetime64[D]'),
+            ('collection', 'f8'), ('withdrawal', 'f8'), ('regulation', 'f8')])
+    table['start'], table['end'] = monthlies.start, monthlies.end
+    table['collection'], table['withdrawal'], table['regulation'] = monthlies.collection, monthlies.withdrawal, monthlies.regulation
+    return table
+
+def _text_columns(table, lo, hi):
+    # each field of rows lo:hi as an array of strings
+    cols = []
+    for name in table.dtype.names:
+        col = table[name][lo:hi]
+        if np.issubdtype(col.dtype, np.datetime64) or col.dtype.kind == 'U':
+            cols.append(col.astype(str))
+        elif col.dtype.kind in 'iub':
+            cols.append(np.char.mod('%d', col))
+        else:
+            cols.append(np.char.mod('%.2f', col))
+    return cols
+
+def _join(cols, parts):
+    # interleaves the column strings with the fixed parts:  parts[0] cols[0] parts[1] cols[1] ... parts[-1]
+    line = np.full(len(cols[0]), parts[0])
+    for col, part in zip(cols, parts[1:]):
+        line = np.char.add(np.char.add(line, col), part)
+    return line
+
+def write_table(table, f, fmt):
+    'Writes a structured array to the open file f:  text mode for jsonl and csv, binary for npy'
+    names = table.dtype.names
+    if fmt == 'npy':
+        np.save(f, table, allow_pickle=False)
+        return
+    if fmt == 'csv':
+        f.write(','.join(names) + '\n')
+        parts = [''] + [','] * (len(names) - 1) + ['\n']
+    elif fmt == 'jsonl':
+        quote = {name: '"' if table.dtype[name].kind in 'MU' else '' for name in names}
+        parts = [(quote[names[i-1]] + ', ' if i else '{') + f'"{name}": ' + quote[name] for i, name in enumerate(names)]
+        parts.append(quote[names[-1]] + '}\n')
+    else:
+        raise ValueError(f'Unknown format {fmt}; use one of {FORMATS}')
+    for lo in range(0, len(table), BLOCK):
+        f.write(''.join(_join(_text_columns(table, lo, lo + BLOCK), parts)))
+
+def write_daily(handler, f, fmt):
+    'Writes the daily results of a computed Handler'
+    write_table(daily_table(handler), f, fmt)
+
+def write_periods(monthlies, f, fmt):
+    'Writes the period totals of a Monthlies'
+    write_table(period_table(monthlies), f, fmt)
+
+def _typed(name, col):
+    # a column of strings as dates for the date fields, otherwise as integers, floats, or strings,
+    # the first type every value reads as
+    if name in ('date', 'start', 'end'):
+        return col.astype('datetime64[D]')
+    for dtype in (np.int64, np.float64):
+        try:
+            return col.astype(dtype)
+        except ValueError:
+            pass
+    return col
+
+def read_table(path, fmt=None):
+    'Reads a file written by write_table back into a structured array; npy files are memory-mapped'
+    # Text formats do not record field types, so each column's type is taken from its values
+    fmt = fmt or str(path).rsplit('.', 1)[-1]
+    if fmt == 'npy':
+        return np.load(path, mmap_mode='r', allow_pickle=False)
+    if fmt == 'csv':
+        with open(path, encoding='utf-8') as f:
+            names = f.readline().strip().split(',')
+            rows = np.loadtxt(f, delimiter=',', dtype=str, ndmin=2)
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        names = list(records[0]) if records else []
+        rows = np.array([[str(r[name]) for name in names] for r in records], dtype=str).reshape(-1, len(names))
+    else:
+        raise ValueError(f'Unknown format {fmt}; use one of {FORMATS}')
+    cols = [_typed(name, rows[:, i]) for i, name in enumerate(names)]
+    table = np.empty(len(rows), dtype=[(name, col.dtype) for name, col in zip(names, cols)])
+    for name, col in zip(names, cols):
+        table[name] = col
+    return table
@@ -0,0 +1,96 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Optional timers and counters for finding where a run spends its time
+# Call enable() to start collecting into a new Profile, and disable() to stop.  While disabled,
+# active is None and the timer() and count() calls placed through the code do nothing.
+# Counters in the daily loop are tallied locally and reported once per call, so they cost
+# next to nothing either way.
+import sys, json, threading, functools
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+class Profile:
+    'Wall-clock seconds per phase and event counters, collected from any thread'
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.seconds[name] = self.seconds.get(name, 0) + seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start)
+
+    def merge(self, other):
+        'Adds in the seconds and counts of another profile, or of its as_dict()'
+        other = other.as_dict() if isinstance(other, Profile) else other
+        for name, seconds in other['seconds'].items(): self.add_time(name, seconds)
+        for name, n in other['counts'].items(): self.count(name, n)
+
+    def as_dict(self):
+        with self.lock:
+            return {'seconds': dict(self.seconds), 'counts': dict(self.counts)}
+
+    def write_json(self, f):
+        json.dump(self.as_dict(), f, indent=1)
+
+    def report(self, f=sys.stdout):
+        'Prints the phases, longest first, then the counters'
+        d = self.as_dict()
+        f.write(f"{'Phase':28s}{'Seconds':>12s}\n")
+        for name, seconds in sorted(d['seconds'].items(), key=lambda item: -item[1]):
+            f.write(f'{name:28s}{seconds:12.4f}\n')
+        f.write(f"{'Counter':28s}{'Count':>12s}\n")
+        for name, n in sorted(d['counts'].items()):
+            f.write(f'{name:28s}{n:12,d}\n')
+
+active = None
+
+def enable():
+    'Starts collecting into a new Profile, and returns it'
+    global active
+    active = Profile()
+    return active
+
+def disable():
+    'Stops collecting.  Returns the Profile collected, or None'
+    global active
+    profile, active = active, None
+    return profile
+
+def timer(name):
+    'Context manager timing the named phase, when enabled'
+    return nullcontext() if active is None else active.timer(name)
+
+def count(name, n=1):
+    if active is not None: active.count(name, n)
+
+def timed(name):
+    'Decorator timing each call as the named phase, when enabled'
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if active is None: return function(*args, **kwargs)
+            with active.timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
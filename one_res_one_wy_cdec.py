@@ -9,15 +9,41 @@
 
 # Storage collection to and withdrawal from other reservoirs
 # specify the CDEC station ID and wateryear as command-line arguments
-import sys, os
+import os, argparse
 from pathlib import Path
-import cdecpuller
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+import cdecpuller, exporters, instrument, screening
+from cdeccache import CdecCache
+from archive import ArchiveAdapter
+from resultcache import ResultCache
 from storagehandler import Handler, Plotter, Monthlies, showplots
 from datetime import date
 
 
-def one_res(station_id, wateryear, initialcoll=True, output_dir=None, nbr_years=1):
+def one_res(station_id, wateryear, initialcoll=True, output_dir=None, nbr_years=1, volume_limit=0, timings=None,
+            cache=None, offline=False, plot=True, plot_format='svg', daily_format='json', result_cache=None, dur_code='D',
+            screen=False, archive=None, label=''):
     "Produce 30-day storage analysis for one reservoir, one or more water years"
+    # Pass a dict as timings to receive the seconds spent in each phase
+    # Pass a file path as cache to keep CDEC data on disk; offline=True then uses only cached data
+    # plot=False skips the plot entirely, and matplotlib is then never imported
+    # plot_format='png' saves a raster plot instead of SVG
+    # daily_format 'jsonl', 'csv', or 'npy' saves dailies and monthly totals in that format instead of JSON
+    # Pass a file path as result_cache to reuse the results of earlier runs on unchanged data
+    # dur_code 'H' (hourly) or 'E' (event) analyzes sub-daily readings; results are per reading, and saved summed by day
+    # screen=True runs the screening.Screen steps on the readings, and saves their quality report
+    # Pass the path of a local archive (see archive.py) as archive to read it in place of CDEC
+    # label is added to the output file names, to keep apart runs of one station and year with other settings
+    # Returns the handler, plotter (None without a plot), and monthly summations
+
+    if timings is None: timings = {}
+    mark = perf_counter()
+    def lap(phase):
+        nonlocal mark
+        now = perf_counter()
+        timings[phase] = timings.get(phase, 0) + now - mark
+        mark = now
 
     # Ensure output directory is available
     if output_dir != None:
@@ -25,60 +51,124 @@ def one_res(station_id, wateryear, initialcoll=True, output_dir=None, nbr_years=
 
     # Connect to a new Handler and set up its boundary conditions
     print(f'Setting up {station_id} for wateryear {wateryear}')
-    handler = Handler(station_id, handle_init=initialcoll)
-    res_name = cdecpuller.get_daily_station_info(station_id)
+    handler = Handler(station_id, handle_init=initialcoll, volume_limit=volume_limit)
 
-    # get data from CDEC
+    # get data from CDEC, looking up the station name at the same time
     # here is where you would replace cdecpuller with your own class which accesses your
-    # company's water-resources time series data store
-    print(f'Retrieving daily midnight readings from {res_name}')
-    adapter = cdecpuller.CdecDailyResAdapter()
-    adapter.fill(handler, date(wateryear-1, 9, 1), nbr_years=nbr_years)
+    # company's water-resources time series data store:  a subclass of adapters.StorageAdapter
+    print(f"Retrieving {dict(D='daily midnight', H='hourly', E='event').get(dur_code, dur_code)} readings from {station_id}")
+    screener = screening.Screen() if screen else None
+    if archive is not None:
+        adapter = ArchiveAdapter(archive, screen=screener)
+        adapter.fill(handler, date(wateryear-1, 9, 1), nbr_years=nbr_years, dur_code=dur_code)
+        res_name = adapter.get_name(station_id)
+        adapter.close()
+    else:
+        if cache is not None: cache = CdecCache(cache)
+        adapter = cdecpuller.CdecDailyResAdapter(cache=cache, offline=offline, screen=screener)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            res_name = pool.submit(cdecpuller.get_daily_station_info, station_id, cache=cache, offline=offline)
+            adapter.fill(handler, date(wateryear-1, 9, 1), nbr_years=nbr_years, dur_code=dur_code)
+            res_name = res_name.result()
+        if cache is not None: cache.close()
+    quality = adapter.reports.get(station_id)
+    if quality is not None: print(quality.summary())
+    lap('fetch')
 
     # Initialize look-back and look-ahead 30 days features
     handler.set_beginnings()
 
     # compute collection, withdrawal, and regulation
+    # and obtain monthly summations
     print('Calculating 30-day rule storage')
-    handler.compute_deltaS()
-
-    # make a diagnostic plot
-    print('Plotting')
-    plotter = Plotter(handler, res_name, station_id, wateryear)
-    plotter.make_plot()
+    if result_cache is None:
+        handler.compute_deltaS()
+        monthly_summations = Monthlies(handler)
+    else:
+        results = ResultCache(result_cache)
+        monthly_summations = results.compute(handler)
+        results.close()
+    lap('compute')
 
-    # Obtain monthly summations, add to plot
-    monthly_summations = Monthlies(handler)
-    monthly_summations.plot_tabulate(plotter.ax)
+    # make a diagnostic plot, with the monthly summations added
+    plotter = None
+    if plot:
+        print('Plotting')
+        plotter = Plotter(handler, res_name, station_id, wateryear)
+        plotter.make_plot()
+        monthly_summations.plot_tabulate(plotter.ax)
+        lap('plot')
 
     # Provide monthly totals as text table and dailies as JSON
     if output_dir != None:
         dest = Path(output_dir)
-        with open(dest / f'{station_id} monthly storage {wateryear}.txt', 'w') as f:
+        with open(dest / f'{station_id} monthly storage {wateryear}{label}.txt', 'w') as f:
             f.write(f'{station_id} {res_name} storage analysis for water year {wateryear}\n\n')
             monthly_summations.text_tabulate(f)
+        if quality is not None:
+            with open(dest / f'{station_id} quality {wateryear}{label}.txt', 'w') as f:
+                quality.text_tabulate(f)
 
-        # Provide daily values to JSON text file
-        with open(dest / f'{station_id} daily storage {wateryear}.json', 'w', encoding='utf-8') as f:
-            handler.store_daily_json(f)
+        # Provide daily values to JSON text file, or another format
+        if daily_format == 'json':
+            with open(dest / f'{station_id} daily storage {wateryear}{label}.json', 'w', encoding='utf-8') as f:
+                handler.store_daily_json(f)
+        else:
+            binary = daily_format == 'npy'
+            with open(dest / f'{station_id} daily storage {wateryear}{label}.{daily_format}', 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+                exporters.write_daily(handler, f, daily_format)
+            with open(dest / f'{station_id} monthly storage {wateryear}{label}.{daily_format}', 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+                exporters.write_periods(monthly_summations, f, daily_format)
         
         # Save a copy of the plot
-        plotter.fig.savefig(dest / f'{station_id} {wateryear}.svg')
+        if plotter is not None:
+            plotter.save(dest / f'{station_id} {wateryear}{label}.{plot_format}')
+        lap('write')
+
+    return handler, plotter, monthly_summations
 
 
 # Main program
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print(f'usage: {sys.argv[0]} station_id wateryear')
+    parser = argparse.ArgumentParser(description='30-day storage analysis of one CDEC reservoir')
+    parser.add_argument('station_id')
+    parser.add_argument('wateryear', type=int)
+    parser.add_argument('--years', type=int, default=1, help='number of water years (default 1)')
+    parser.add_argument('--output-dir', help='save the text, JSON, and plot files in this folder')
+    parser.add_argument('--no-plot', action='store_true', help='compute and save results only; no plot')
+    parser.add_argument('--format', choices=('svg', 'png'), default='svg', help='saved plot file format')
+    parser.add_argument('--daily-format', choices=('json',) + exporters.FORMATS, default='json', help='format of the saved daily values')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite file to keep CDEC data between runs')
+    parser.add_argument('--offline', action='store_true', help='use only data already in the cache')
+    parser.add_argument('--result-cache', metavar='PATH', help='SQLite file to reuse results of unchanged data')
+    parser.add_argument('--archive', metavar='PATH', help='read storage from this local archive (see archive.py) instead of CDEC')
+    parser.add_argument('--screen', action='store_true', help='screen the readings for gaps, spikes, and flatlines, and save a quality report')
+    parser.add_argument('--duration', choices=('D', 'H', 'E'), default='D', help='CDEC duration code:  daily (default), hourly, or event readings')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON', help='print time per phase and counters; optionally save them as JSON')
+    args = parser.parse_args()
+
+    if args.profile is not None: instrument.enable()
+    station_id = args.station_id.upper()
+    cache = CdecCache(args.cache) if args.cache else None
+    ok = args.archive or cdecpuller.confirm_ok(station_id, dur_code=args.duration, cache=cache, offline=args.offline)
+    if cache is not None: cache.close()
+    if not ok:
+        print(f'No CDEC daily reservoir storage station {station_id}')
     else:
-        station_id, wateryear = sys.argv[1].upper(), int(sys.argv[2])
-        if not cdecpuller.confirm_ok(station_id):
-            print(f'No CDEC daily reservoir storage station {station_id}')
-        else:
-            # Demonstration: one water year, don't save output, handle initial collection to storage
-            one_res(station_id, wateryear)
-            
-            # Another example; two water years, save output in a sibling folder
-            #one_res(station_id, wateryear, nbr_years=2, output_dir='../sa')
-            
+        # Demonstration: one water year, don't save output, handle initial collection to storage
+        # Example with options: two water years, save output in a sibling folder
+        #   python one_res_one_wy_cdec.py ORO 2021 --years 2 --output-dir ../sa
+        one_res(station_id, args.wateryear, output_dir=args.output_dir, nbr_years=args.years,
+                cache=args.cache, offline=args.offline, plot=not args.no_plot, plot_format=args.format,
+                daily_format=args.daily_format, result_cache=args.result_cache, dur_code=args.duration,
+                screen=args.screen, archive=args.archive)
+
+        profile = instrument.disable()
+        if profile is not None:
+            profile.report()
+            if args.profile:
+                with open(args.profile, 'w') as f:
+                    profile.write_json(f)
+
+        if not args.no_plot:
             showplots()
\ No newline at end of file
@@ -0,0 +1,103 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Saved results of compute_deltaS and Monthlies, kept in one SQLite file
+# Each entry is keyed by a SHA-256 hash of everything the results depend on:  the dates, storage,
+# and flags of the record, the Handler parameters, the season start, the reporting period, and
+# ALGORITHM_VERSION.  Any change to the data or parameters gives a new key, so stale results are
+# never returned.  When the saved results exceed max_bytes, the least recently used are dropped.
+import sqlite3, threading, hashlib, io, time
+import numpy as np
+from storagehandler import ALGORITHM_VERSION, DailyResults, Monthlies
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    data BLOB,
+    size INTEGER,
+    used REAL);  -- time.time() of the last store or load
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+'''
+
+def _locked(method):
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def result_key(handler, period='month'):
+    'Hex digest identifying the inputs of compute_deltaS and Monthlies for this handler'
+    record = handler._storage
+    h = hashlib.sha256()
+    for column in (record.dates, record.storage, record.flags):
+        h.update(np.ascontiguousarray(column).tobytes())
+    if not isinstance(period, str):
+        period = np.asarray(period, dtype='datetime64[D]').astype(str).tolist()
+    params = (ALGORITHM_VERSION, len(record), handler.volume_limit, handler.HANDLE_INIT, handler.season_start,
+              handler.window, handler.drawdown, period)
+    h.update(repr(params).encode())
+    return h.hexdigest()
+
+class ResultCache:
+    'On-disk, size-bounded store of daily results and period totals'
+
+    def __init__(self, path='result_cache.sqlite', max_bytes=256*2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.executescript(_SCHEMA)
+
+    @_locked
+    def close(self):
+        self.db.close()
+
+    @_locked
+    def load(self, key):
+        'Returns (DailyResults, Monthlies) saved under key, or None'
+        row = self.db.execute('SELECT data FROM results WHERE key=?', (key,)).fetchone()
+        if row is None: return None
+        with self.db:
+            self.db.execute('UPDATE results SET used=? WHERE key=?', (time.time(), key))
+        saved = np.load(io.BytesIO(row[0]), allow_pickle=False)
+        period = str(saved['period']) if saved['period'].ndim == 0 else saved['period']
+        cwr = DailyResults(saved['dates'], saved['values'])
+        monthlies = Monthlies.from_totals(period, saved['start'], saved['end'],
+                                          saved['collection'], saved['withdrawal'], saved['regulation'])
+        return cwr, monthlies
+
+    @_locked
+    def store(self, key, cwr, monthlies):
+        'Saves the results under key, then drops the least recently used entries beyond max_bytes'
+        buffer = io.BytesIO()
+        np.savez(buffer, dates=cwr.dates, values=cwr.values, period=np.asarray(monthlies.period),
+                 start=monthlies.start, end=monthlies.end, collection=monthlies.collection,
+                 withdrawal=monthlies.withdrawal, regulation=monthlies.regulation)
+        data = buffer.getvalue()
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?,?,?,?)', (key, data, len(data), time.time()))
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            for old, size in self.db.execute('SELECT key, size FROM results ORDER BY used').fetchall():
+                if total <= self.max_bytes or old == key: break
+                self.db.execute('DELETE FROM results WHERE key=?', (old,))
+                total -= size
+
+    def compute(self, handler, period='month'):
+        'compute_deltaS and Monthlies(handler, period), or their saved results.  Returns the Monthlies'
+        key = result_key(handler, period)
+        saved = self.load(key)
+        if saved is not None:
+            handler.cwr, monthlies = saved
+            handler._season = None  # no season state to continue from; append() needs compute_deltaS
+            handler.provisional = np.zeros(len(handler.cwr), dtype=bool)
+            return monthlies
+        handler.compute_deltaS()
+        monthlies = Monthlies(handler, period)
+        self.store(key, handler.cwr, monthlies)
+        return monthlies
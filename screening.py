@@ -0,0 +1,192 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Data-quality screening of storage series, between an adapter and the Handler
+# A Screen runs a list of steps over (dates, values, flags) arrays.  Each step is a callable
+#   step(dates, values, flags, report) -> (dates, values, flags)
+# Bad values are marked NaN by the rejecting steps and replaced by FillGaps; readings which cannot
+# be trusted get the strikeout flag, bit 0, so compute_deltaS counts their change in storage as
+# regulation rather than collection or withdrawal.  The default steps, in order:
+#   Reindex        sorts, drops repeated dates, and puts daily records on a contiguous daily axis
+#   RejectNegative negative storage is missing
+#   RejectSpikes   a reading jumping away from both neighbors by more than max_change a day is missing
+#   FlagFlatlines  a value repeated unchanged for flatline_days or more, other than at the lowest or highest
+#                  storage of the record, is struck out
+#   FillGaps       missing values are interpolated, or carried forward; gaps longer than max_fill days are struck out
+# Every step is O(n) NumPy.  Steps are plain classes, so a Screen can be sent to worker processes.
+# Example:
+#   dates, storage, flags, report = Screen()(station_id, dates, storage)
+#   handler._storage = StorageRecord(dates, storage, flags)
+import numpy as np
+import instrument
+
+DAY = np.timedelta64(1, 'D')
+
+def _days(times):
+    # times as float days since the first, for daily and sub-daily dates alike
+    return (times - times[0]) / DAY if len(times) else np.zeros(0)
+
+def _runs(mask):
+    # (start, stop) index pairs of the runs of True in mask
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+class QualityReport:
+    'What screening found and did to the record of one station'
+
+    COUNTS = ('observations', 'repeated', 'missing', 'negative', 'spikes', 'flatline', 'filled', 'struck')
+
+    def __init__(self, station_id):
+        self.station_id = station_id
+        self.first = self.last = None
+        for name in self.COUNTS: setattr(self, name, 0)
+        self.gaps = []  # (first missing, last missing) dates, or times, of each gap in the readings
+
+    def as_dict(self):
+        return {'station': self.station_id, 'first': str(self.first), 'last': str(self.last),
+                **{name: getattr(self, name) for name in self.COUNTS},
+                'gaps': [(str(a), str(b)) for a, b in self.gaps]}
+
+    def summary(self):
+        'One line of counts'
+        return f'{self.station_id} {self.first} to {self.last}:  ' + ', '.join(f'{getattr(self, name)} {name}' for name in self.COUNTS)
+
+    def text_tabulate(self, f):
+        f.write(self.summary() + '\n')
+        for a, b in self.gaps:
+            f.write(f'  gap {a} to {b}\n')
+
+class Reindex:
+    'Sorts by date, keeps the first of repeated dates, and fills in missing days of daily records as NaN'
+
+    def __call__(self, dates, values, flags, report):
+        if len(dates) and np.any(dates[1:] <= dates[:-1]):
+            order = np.argsort(dates, kind='stable')
+            dates, values, flags = dates[order], values[order], flags[order]
+            keep = np.concatenate(([True], dates[1:] != dates[:-1]))
+            report.repeated += int(len(keep) - keep.sum())
+            dates, values, flags = dates[keep], values[keep], flags[keep]
+        if len(dates) < 2: return dates, values, flags
+        if dates.dtype == np.dtype('datetime64[D]'):
+            index = (dates - dates[0]).astype(np.int64)
+            if index[-1] + 1 == len(dates): return dates, values, flags
+            axis = dates[0] + np.arange(index[-1] + 1).astype('timedelta64[D]')
+            full, full_flags = np.full(len(axis), np.nan), np.zeros(len(axis), dtype=np.int8)
+            full[index], full_flags[index] = values, flags
+            step = np.diff(index)
+            for i in np.flatnonzero(step > 1):
+                report.gaps.append((axis[index[i]+1], axis[index[i+1]-1]))
+            report.missing += len(axis) - len(dates)
+            return axis, full, full_flags
+        # sub-daily readings need no common axis; gaps over twice the usual interval are reported
+        step = np.diff(dates)
+        for i in np.flatnonzero(step > 2 * np.median(step)):
+            report.gaps.append((dates[i], dates[i+1]))
+        return dates, values, flags
+
+class RejectNegative:
+    'Negative storage readings are missing'
+
+    def __call__(self, dates, values, flags, report):
+        bad = values < 0
+        report.negative += int(bad.sum())
+        return dates, np.where(bad, np.nan, values), flags
+
+class RejectSpikes:
+    'A reading which jumps away from the one before and back to the one after, both by more than max_change of the largest storage a day, is missing'
+
+    # The rate is taken over no less than a day, so readings an hour apart may each move max_change
+    def __init__(self, max_change=0.25):
+        self.max_change = max_change
+
+    def __call__(self, dates, values, flags, report):
+        if len(values) < 3 or np.all(np.isnan(values)): return dates, values, flags
+        limit = self.max_change * np.nanmax(values)
+        jump = np.diff(values)
+        with np.errstate(invalid='ignore'):
+            fast = np.abs(jump) > limit * np.maximum(np.diff(_days(dates)), 1)
+            spike = fast[:-1] & fast[1:] & (np.sign(jump[:-1]) != np.sign(jump[1:]))
+        spike = np.concatenate(([False], spike, [False]))
+        report.spikes += int(spike.sum())
+        return dates, np.where(spike, np.nan, values), flags
+
+class FlagFlatlines:
+    'Readings repeating one value unchanged for flatline_days or more, as a stuck sensor would, are struck out; the first of them is kept'
+
+    # A reservoir held full, or at its lowest, may well stay level that long, so those runs are kept
+    def __init__(self, flatline_days=30):
+        self.flatline_days = flatline_days
+
+    def __call__(self, dates, values, flags, report):
+        if len(values) < 2: return dates, values, flags
+        same = np.concatenate(([False], values[1:] == values[:-1]))
+        starts, stops = _runs(same)
+        days = _days(dates)
+        level = values[starts - 1]
+        long = (days[stops - 1] - days[starts - 1] >= self.flatline_days) & (level > np.nanmin(values)) & (level < np.nanmax(values))
+        edges = np.zeros(len(values) + 1, dtype=np.int64)
+        np.add.at(edges, starts[long], 1)
+        np.add.at(edges, stops[long], -1)
+        stuck = np.cumsum(edges[:-1]) > 0
+        report.flatline += int(stuck.sum())
+        return dates, values, np.where(stuck, flags | 1, flags).astype(np.int8)
+
+class FillGaps:
+    'Missing values are interpolated (method "interpolate") or carried forward ("carry"); gaps longer than max_fill days are struck out'
+
+    def __init__(self, method='interpolate', max_fill=7):
+        assert method in ('interpolate', 'carry')
+        self.method = method
+        self.max_fill = max_fill
+
+    def __call__(self, dates, values, flags, report):
+        bad = np.isnan(values)
+        if not bad.any(): return dates, values, flags
+        if bad.all():
+            raise ValueError(f'No good storage readings from station_id {report.station_id}')
+        n = len(values)
+        good = np.flatnonzero(~bad)
+        days = _days(dates)
+        if self.method == 'interpolate':
+            filled = np.interp(days, days[good], values[good])
+        else:
+            last = np.maximum.accumulate(np.where(bad, 0, np.arange(n)))
+            filled = values[np.where(bad[last], good[0], last)]
+        # the span from the good reading before each gap to the one after it
+        before = np.maximum.accumulate(np.where(bad, -1, np.arange(n)))
+        after = np.minimum.accumulate(np.where(bad, n, np.arange(n))[::-1])[::-1]
+        open_ended = bad & ((before < 0) | (after >= n))
+        span = days[np.minimum(after, n-1)] - days[np.maximum(before, 0)]
+        strike = open_ended | (bad & (span > self.max_fill + 1))
+        report.filled += int(bad.sum())
+        return dates, filled, np.where(strike, flags | 1, flags).astype(np.int8)
+
+def default_steps():
+    return [Reindex(), RejectNegative(), RejectSpikes(), FlagFlatlines(), FillGaps()]
+
+class Screen:
+    'Runs the screening steps over one station record'
+
+    def __init__(self, steps=None):
+        self.steps = default_steps() if steps is None else list(steps)
+
+    @instrument.timed('screen')
+    def __call__(self, station_id, dates, values, flags=None):
+        'Returns (dates, values, flags, QualityReport)'
+        report = QualityReport(station_id)
+        dates = np.asarray(dates)
+        values = np.array(values, dtype=np.float64)
+        flags = np.zeros(len(dates), dtype=np.int8) if flags is None else np.array(flags, dtype=np.int8)
+        report.observations = int(np.count_nonzero(~np.isnan(values)))
+        for step in self.steps:
+            dates, values, flags = step(dates, values, flags, report)
+        if len(dates):
+            report.first, report.last = dates[0], dates[-1]
+        report.struck = int(np.count_nonzero(flags & 1))
+        return dates, values, flags, report
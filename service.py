@@ -0,0 +1,295 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Local HTTP service keeping storage analyses in memory, for dashboards asking for them repeatedly
+# Each analysis (station, water year, and options) is computed once, as a provisional draft, and its
+# Handler is kept.  Once it is older than refresh seconds, the next request for it starts a refresh in the
+# background, which reads only the readings since the last one and appends them (Handler.append); until
+# then requests are answered from what is in memory.  The responses rendered from an analysis are kept
+# with it, and the least recently used analyses are dropped beyond max_entries.
+# Computing, rendering, and refreshing run on a pool of worker threads.
+# Requests, all GET, with the query parameters station and wateryear, and optionally years, handle_init,
+# volume_limit, and duration (D, H, or E):
+#   /dailies    daily values; format json (as store_daily_json, the default), jsonl, csv, or npy
+#   /monthlies  monthly totals; format text (the default), jsonl, csv, or npy
+#   /plot       the diagnostic plot; format png (the default) or svg
+#   /status     analyses in memory, and counts of hits, misses, and refreshes, as JSON
+# Example:
+#   python service.py --port 8030 --cache cdec_cache.sqlite
+#   curl "http://127.0.0.1:8030/monthlies?station=ORO&wateryear=2021"
+import os, io, json, threading, argparse
+os.environ.setdefault('MPLBACKEND', 'Agg')  # headless; no display needed
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from time import monotonic
+from datetime import date
+import numpy as np
+from storagehandler import Handler, Plotter, Monthlies
+from adapters import fetch_end
+import cdecpuller, exporters, screening
+from cdeccache import CdecCache
+from archive import ArchiveAdapter
+
+CONTENT_TYPES = {'json': 'application/json', 'jsonl': 'application/x-ndjson', 'csv': 'text/csv', 'text': 'text/plain',
+                 'npy': 'application/octet-stream', 'png': 'image/png', 'svg': 'image/svg+xml'}
+FORMATS = {'dailies': ('json',) + exporters.FORMATS, 'monthlies': ('text',) + exporters.FORMATS, 'plot': ('png', 'svg')}
+
+class _Analysis:
+    # One analysis kept in memory:  its Handler, monthly totals, and the responses rendered from them
+    def __init__(self, key):
+        self.key = key
+        self.lock = threading.Lock()
+        self.handler = self.monthlies = self.res_name = None
+        self.fetched = 0  # monotonic() of the last read
+        self.refreshing = False
+        self.responses = {}  # (kind, format): bytes
+
+class AnalysisService:
+    'Storage analyses kept in memory and brought up to date from an adapter'
+
+    # adapter is any adapters.StorageAdapter; it is shared by the workers
+    def __init__(self, adapter, workers=4, max_entries=64, refresh=300):
+        self.adapter = adapter
+        self.refresh = refresh
+        self.max_entries = max_entries
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.plot_lock = threading.Lock()  # pyplot is not thread-safe
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.refreshes = 0
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def _entry(self, key):
+        # the analysis for key, most recently used; new ones are empty until computed
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = _Analysis(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+            return entry
+
+    def response(self, kind, fmt, station_id, wateryear, nbr_years=1, handle_init=True, volume_limit=0, dur_code='D'):
+        'Returns the bytes of a dailies, monthlies, or plot response, computing the analysis first if it is not in memory'
+        key = (station_id, wateryear, nbr_years, handle_init, volume_limit, dur_code)
+        entry = self._entry(key)
+        body = entry.responses.get((kind, fmt))
+        if body is None:
+            try:
+                body = self.pool.submit(self._respond, entry, kind, fmt).result()
+            except Exception:
+                with self.lock:
+                    if self.entries.get(key) is entry and entry.handler is None: del self.entries[key]
+                raise
+        else:
+            self.hits += 1
+        if monotonic() - entry.fetched > self.refresh:
+            with self.lock:
+                start, entry.refreshing = not entry.refreshing, True
+            if start: self.pool.submit(self._refresh, entry)
+        return body
+
+    def _respond(self, entry, kind, fmt):
+        # worker:  computes the analysis if need be, and renders the response
+        with entry.lock:
+            if entry.handler is None:
+                self.misses += 1
+                self._compute(entry)
+            body = entry.responses.get((kind, fmt))
+            if body is None:
+                body = entry.responses[(kind, fmt)] = self._render(entry, kind, fmt)
+            else:
+                self.hits += 1
+            return body
+
+    def _compute(self, entry):
+        station_id, wateryear, nbr_years, handle_init, volume_limit, dur_code = entry.key
+        handler = Handler(station_id, handle_init=handle_init, volume_limit=volume_limit)
+        entry.fetched = monotonic()
+        self.adapter.fill(handler, date(wateryear-1, 9, 1), nbr_years=nbr_years, dur_code=dur_code)
+        handler.set_beginnings()
+        handler.compute_deltaS(provisional=True)
+        entry.handler, entry.monthlies = handler, Monthlies(handler)
+        entry.res_name = self.adapter.get_name(station_id)
+        entry.responses.clear()
+
+    def _refresh(self, entry):
+        # worker:  reads the readings after the last one in memory, and appends them
+        try:
+            station_id, wateryear, nbr_years, handle_init, volume_limit, dur_code = entry.key
+            handler = entry.handler
+            if handler is None: return
+            last = handler._storage.dates[-1]
+            start, end = handler.get_right_limit().astype(date), fetch_end(date(wateryear-1, 9, 1), nbr_years)
+            fetched = monotonic()
+            try:
+                new = self.adapter.fetch(station_id, start, end, dur_code) if start <= end else None
+            except ValueError:
+                new = None  # nothing new yet
+            with entry.lock:
+                entry.fetched = fetched
+                if new is None: return
+                later = new[0] > last
+                dates, storage, flags = new[0][later], new[1][later], None if new[2] is None else new[2][later]
+                if len(dates) == 0: return
+                continues = dates[0] > last if handler.subdaily else dates[0] == last + np.timedelta64(1, 'D')
+                if continues:
+                    handler.append(dates, storage, flags)
+                    entry.monthlies = Monthlies(handler)
+                    entry.responses.clear()
+                else:
+                    self._compute(entry)  # a gap in the readings; start over
+                self.refreshes += 1
+        except Exception as e:
+            print(f'Refresh of {entry.key} failed: {type(e).__name__}: {e}')
+        finally:
+            entry.refreshing = False
+
+    def _render(self, entry, kind, fmt):
+        handler, monthlies = entry.handler, entry.monthlies
+        station_id, wateryear = entry.key[:2]
+        if kind == 'plot':
+            with self.plot_lock:
+                plotter = Plotter(handler, entry.res_name, station_id, wateryear)
+                plotter.make_plot()
+                monthlies.plot_tabulate(plotter.ax)
+                f = io.BytesIO()
+                plotter.save(f, format=fmt)
+                plotter.close()
+            return f.getvalue()
+        if fmt == 'npy':
+            f = io.BytesIO()
+            exporters.write_table(exporters.daily_table(handler) if kind == 'dailies' else exporters.period_table(monthlies), f, fmt)
+            return f.getvalue()
+        f = io.StringIO()
+        if kind == 'dailies' and fmt == 'json':
+            handler.store_daily_json(f)
+        elif kind == 'dailies':
+            exporters.write_daily(handler, f, fmt)
+        elif fmt == 'text':
+            f.write(f'{station_id} {entry.res_name} storage analysis for water year {wateryear}\n\n')
+            monthlies.text_tabulate(f)
+        else:
+            exporters.write_periods(monthlies, f, fmt)
+        return f.getvalue().encode('utf-8')
+
+    def warm(self, rows):
+        'Computes the analyses of batch.read_manifest rows in the background'
+        def run():
+            for row in rows:
+                try:
+                    self.response('monthlies', 'text', row['station'], row['wateryear'],
+                                  handle_init=row['handle_init'], volume_limit=row['volume_limit'])
+                except Exception as e:
+                    print(f"Warming {row['station']} {row['wateryear']} failed: {type(e).__name__}: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    def status(self):
+        'Analyses in memory, and counts, as a dict'
+        with self.lock:
+            entries = list(self.entries.values())
+        now = monotonic()
+        return {'workers': self.workers, 'max_entries': self.max_entries, 'refresh': self.refresh,
+                'hits': self.hits, 'misses': self.misses, 'refreshes': self.refreshes,
+                'analyses': [{'station': e.key[0], 'wateryear': e.key[1], 'years': e.key[2], 'handle_init': e.key[3],
+                              'volume_limit': e.key[4], 'duration': e.key[5], 'computed': e.handler is not None,
+                              'last': str(e.handler._storage.dates[-1]) if e.handler is not None else None,
+                              'age': round(now - e.fetched, 1), 'responses': len(e.responses)} for e in entries]}
+
+def _arguments(query):
+    # response() arguments from the query parameters; raises ValueError or KeyError on bad ones
+    return dict(station_id=query['station'].upper(), wateryear=int(query['wateryear']), nbr_years=int(query.get('years', 1)),
+                handle_init=query.get('handle_init', 'true').lower() not in ('false', 'no', 'n', '0'),
+                volume_limit=float(query.get('volume_limit', 0)), dur_code=query.get('duration', 'D').upper())
+
+def make_server(service, host='127.0.0.1', port=8030):
+    'An HTTP server answering requests from service; call serve_forever() on it'
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+
+        def _send(self, code, content_type, body):
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            kind = url.path.strip('/')
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if kind == 'status':
+                self._send(200, CONTENT_TYPES['json'], json.dumps(service.status(), indent=1).encode())
+                return
+            if kind not in FORMATS:
+                self._send(404, CONTENT_TYPES['text'], b'Use /dailies, /monthlies, /plot, or /status\n')
+                return
+            fmt = query.get('format', FORMATS[kind][0])
+            try:
+                arguments = _arguments(query)
+                if fmt not in FORMATS[kind] or arguments['dur_code'] not in ('D', 'H', 'E'): raise ValueError(fmt)
+            except (KeyError, ValueError):
+                self._send(400, CONTENT_TYPES['text'], f'Give station and wateryear; format one of {FORMATS[kind]}\n'.encode())
+                return
+            try:
+                body = service.response(kind, fmt, **arguments)
+            except ValueError as e:
+                self._send(404, CONTENT_TYPES['text'], f'{e}\n'.encode())
+                return
+            except Exception as e:
+                self._send(500, CONTENT_TYPES['text'], f'{type(e).__name__}: {e}\n'.encode())
+                return
+            self._send(200, CONTENT_TYPES[fmt], body)
+
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    return server
+
+# Main program
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local HTTP service of 30-day storage analyses, kept in memory')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default 127.0.0.1, this computer only)')
+    parser.add_argument('--port', type=int, default=8030)
+    parser.add_argument('--workers', type=int, default=4, help='worker threads computing and rendering')
+    parser.add_argument('--entries', type=int, default=64, help='analyses kept in memory')
+    parser.add_argument('--refresh', type=float, default=300, help='seconds before an analysis is brought up to date')
+    parser.add_argument('--warm', metavar='MANIFEST', help='compute the analyses of a batch.py manifest at start')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite file to keep CDEC data between runs')
+    parser.add_argument('--offline', action='store_true', help='use only data already in the cache')
+    parser.add_argument('--archive', metavar='PATH', help='read storage from this local archive (see archive.py) instead of CDEC')
+    parser.add_argument('--screen', action='store_true', help='screen the readings for gaps, spikes, and flatlines')
+    args = parser.parse_args()
+
+    screener = screening.Screen() if args.screen else None
+    if args.archive:
+        adapter = ArchiveAdapter(args.archive, screen=screener)
+    else:
+        adapter = cdecpuller.CdecDailyResAdapter(cache=CdecCache(args.cache) if args.cache else None, offline=args.offline, screen=screener)
+    service = AnalysisService(adapter, workers=args.workers, max_entries=args.entries, refresh=args.refresh)
+    if args.warm:
+        from batch import read_manifest
+        with open(args.warm, newline='') as f:
+            rows = read_manifest(f)
+        service.warm(rows)
+    server = make_server(service, args.host, args.port)
+    print(f'Serving on http://{args.host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    service.close()
@@ -8,20 +8,320 @@
 ## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
 
 import numpy as np
-import matplotlib.pyplot as plt
+from bisect import bisect_left, bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
+import instrument
+
+# Matplotlib is imported only once something is plotted, so Handler and Monthlies
+# can be used for computing alone without its startup cost or a display
+def _pyplot():
+    import matplotlib.pyplot as plt
+    return plt
 
 def showplots():
     'Display any created plot(s) interactively on screen'
-    plt.show()
+    _pyplot().show()
+
+# Bump whenever a change to compute_deltaS or Monthlies changes their results, so saved results
+# (see resultcache.py) computed by the old code are not reused
+ALGORITHM_VERSION = 3
+
+def _as_times(dates):
+    # datetime64[D] for dates, datetime64[m] for times of day, as in sub-daily records
+    dates = np.asarray(dates)
+    if dates.dtype.kind == 'M' and np.datetime_data(dates.dtype)[0] not in ('Y', 'M', 'W', 'D'):
+        return dates.astype('datetime64[m]')
+    return dates.astype('datetime64[D]')
+
+class StorageRecord:
+    'Storage observations as typed columns:  dates, storage (acre-feet), and bit flags'
+
+    # Columns live in preallocated buffers which grow by doubling, so appending days is cheap.
+    # Indexing [0], [1], [2] returns the date, storage, and flag columns, like the 3-row array
+    # this replaces, so record[2][i] |= 4 still sets a flag in place.
+    # Daily records have datetime64[D] dates; records given times of day, such as hourly
+    # observations, keep them as datetime64[m].
+    __slots__ = ('_dates', '_storage', '_flags', '_length')
+
+    def __init__(self, dates, storage, flags=None, capacity=0):
+        n = len(dates)
+        self._length = 0
+        self._dates = np.empty(max(n, capacity), dtype=_as_times(dates[:1]).dtype)
+        self._storage = np.empty(max(n, capacity), dtype=np.float64)
+        self._flags = np.empty(max(n, capacity), dtype=np.int8)
+        self.append(dates, storage, flags)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, col):
+        return (self.dates, self.storage, self.flags)[col]
+
+    @property
+    def dates(self):
+        return self._dates[:self._length]
+
+    @property
+    def storage(self):
+        return self._storage[:self._length]
+
+    @property
+    def flags(self):
+        return self._flags[:self._length]
+
+    @property
+    def nbytes(self):
+        return self._dates.nbytes + self._storage.nbytes + self._flags.nbytes
+
+    def reserve(self, capacity):
+        if capacity <= len(self._storage): return
+        for name in ('_dates', '_storage', '_flags'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._length] = old[:self._length]
+            setattr(self, name, new)
+
+    def append(self, dates, storage, flags=None):
+        n, m = self._length, len(dates)
+        if n + m > len(self._storage):
+            self.reserve(max(n + m, 2 * len(self._storage)))
+        self._dates[n:n+m] = np.asarray(dates).astype(self._dates.dtype)
+        self._storage[n:n+m] = np.asarray(storage, dtype=np.float64)
+        self._flags[n:n+m] = 0 if flags is None else np.asarray(flags, dtype=np.int8)
+        self._length = n + m
+
+class DailyResults:
+    'Daily 30-day rule results:  a date column plus six float64 columns of acre-feet'
+
+    # For a sub-daily record there is one result per observation, and the dates are its times.
+    # Indexing [0] returns the dates and [1] through [6] the columns named in COLUMNS,
+    # matching the row layout of the 7-row array this replaces.
+    COLUMNS = ('collection_refill', 'withdrawal_after', 'regulation', 'collection_init', 'withdrawal_prereg', 'calcs')
+    __slots__ = ('dates', 'values')
+
+    def __init__(self, dates, values):
+        self.dates = _as_times(dates)
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(self.COLUMNS), len(self.dates))
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, row):
+        if row == 0: return self.dates
+        if not 1 <= row <= len(self.COLUMNS): raise IndexError(row)
+        return self.values[row-1]
+
+    def column(self, name):
+        return self.values[self.COLUMNS.index(name)]
+
+def _rolling_min(x, w):
+    'Minimum of each length-w window along the last axis of x, as r[..., j] = min(x[..., j:j+w]); one O(n) pass'
+    # van Herk / Gil-Werman:  split x into blocks of w, take running minimums forward and backward
+    # within each block; any window spans at most two blocks, so it is the min of one suffix and one prefix
+    rows, n = x.shape[:-1], x.shape[-1]
+    k = -(-n // w)
+    blocks = np.full(rows + (k*w,), np.inf)
+    blocks[..., :n] = x
+    blocks = blocks.reshape(rows + (k, w))
+    prefix = np.minimum.accumulate(blocks, axis=-1).reshape(rows + (k*w,))
+    suffix = np.minimum.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1].reshape(rows + (k*w,))
+    j = np.arange(n-w+1)
+    return np.minimum(suffix[..., j], prefix[..., j+w-1])
+
+def _window_minimums(ts, w, lo, hi):
+    # For each day ind in lo..hi-1, the lowest storage on the w days following it, ind+1 through
+    # ind+w, and on the w-1 days preceding it.  Windows are truncated at the ends of ts.
+    # ts may also be 2-D, one record per row, all computed at once.
+    x = np.asarray(ts, dtype=float)
+    a, b = max(0, lo - (w-1)), min(x.shape[-1], hi + w)
+    x = x[..., a:b]
+    n = x.shape[-1]
+    pad = np.full(x.shape[:-1] + (w,), np.inf)
+    ahead = _rolling_min(np.concatenate((x[..., 1:], pad), axis=-1), w)[..., :n]
+    behind = _rolling_min(np.concatenate((pad[..., :w-1], x), axis=-1), w-1)[..., :n]
+    if a > 0: behind[..., :w-1] = np.inf  # never used; their windows reach before a
+    return ahead[..., lo-a:hi-a], behind[..., lo-a:hi-a]
+
+def _min_table(x):
+    # Sparse table for range minimums:  table[k, j] = min(x[j : j + 2**k]), inf past the end.
+    # O(n log n) to build, then any range is the min of two overlapping power-of-2 ranges.
+    levels = max(1, len(x).bit_length())
+    table = np.full((levels, len(x)), np.inf)
+    table[0] = x
+    for k in range(1, levels):
+        step = 1 << (k-1)
+        table[k, :len(x)-step] = np.minimum(table[k-1, :len(x)-step], table[k-1, step:])
+    return table
+
+def _range_min(table, lo, hi):
+    # min(x[lo:hi]) for arrays of bounds lo and hi; inf where the range is empty
+    n = table.shape[1]
+    size = hi - lo
+    k = np.zeros(len(size), dtype=np.int64)
+    k[size > 0] = np.log2(size[size > 0]).astype(np.int64)
+    k = np.minimum(k, table.shape[0] - 1)
+    left = np.clip(lo, 0, max(0, n-1))
+    right = np.clip(hi - (1 << k), 0, max(0, n-1))
+    if n == 0: return np.full(len(size), np.inf)
+    return np.where(size > 0, np.minimum(table[k, left], table[k, right]), np.inf)
+
+def _time_window_minimums(times, ts, w, lo, hi):
+    # As _window_minimums, for observations at any times:  for each one, ind in lo..hi-1, the lowest
+    # storage observed after it through w days later, and from w-1 days before it until it
+    t = np.asarray(times, dtype='datetime64[m]')
+    x = np.asarray(ts, dtype=float)
+    if hi <= lo: return np.zeros(0), np.zeros(0)
+    ahead_days, behind_days = np.timedelta64(w, 'D'), np.timedelta64(w-1, 'D')
+    a = np.searchsorted(t, t[lo] - behind_days)
+    b = np.searchsorted(t, t[hi-1] + ahead_days, 'right')
+    table = _min_table(x[a:b])
+    ind = np.arange(lo, hi)
+    ahead = _range_min(table, ind+1-a, np.searchsorted(t, t[lo:hi] + ahead_days, 'right')-a)
+    behind = _range_min(table, np.searchsorted(t, t[lo:hi] - behind_days)-a, ind-a)
+    return ahead, behind
+
+def season_beginnings(dates, month=10, day=1):
+    'Boolean array, True on the dates which are month/day'
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    return ((months - dates.astype('datetime64[Y]')).astype(int) == month-1) & ((dates - months).astype(int) == day-1)
+
+class _SortedList:
+    'Sorted floats kept in blocks, so an insert moves at most a block rather than the whole list'
+
+    # With sub-daily records a season holds many thousands of observations, where inserting into
+    # one flat list would make the season quadratic.  offsets[b] is the number of values before block b.
+    BLOCK = 1024
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        self.blocks = [values[i:i+self.BLOCK] for i in range(0, len(values), self.BLOCK)] or [[]]
+        self._index()
+
+    def _index(self):
+        self.maxes = [block[-1] if block else np.inf for block in self.blocks]
+        self.offsets = np.concatenate(([0], np.cumsum([len(block) for block in self.blocks[:-1]], dtype=np.int64)))
+
+    def __len__(self):
+        return int(self.offsets[-1]) + len(self.blocks[-1])
+
+    def __iter__(self):
+        for block in self.blocks: yield from block
+
+    def copy(self):
+        return _SortedList(self)
+
+    def clear(self):
+        self.blocks = [[]]
+        self._index()
+
+    def insert(self, v):
+        b = min(bisect_left(self.maxes, v), len(self.blocks) - 1)
+        block = self.blocks[b]
+        insort(block, v)
+        self.maxes[b] = block[-1]
+        if b+1 < len(self.blocks): self.offsets[b+1:] += 1
+        if len(block) > 2*self.BLOCK:
+            self.blocks[b:b+1] = [block[:self.BLOCK], block[self.BLOCK:]]
+            self._index()
+
+    def bisect_left(self, v):
+        if len(self.blocks) == 1: return bisect_left(self.blocks[0], v)
+        b = bisect_left(self.maxes, v)
+        if b == len(self.blocks): return len(self)
+        return int(self.offsets[b]) + bisect_left(self.blocks[b], v)
+
+    def bisect_right(self, v):
+        if len(self.blocks) == 1: return bisect_right(self.blocks[0], v)
+        b = bisect_right(self.maxes, v)
+        if b == len(self.blocks): return len(self)
+        return int(self.offsets[b]) + bisect_right(self.blocks[b], v)
+
+    def between(self, lo, hi):
+        # the values v with lo < v < hi, in order
+        found = []
+        for b in range(bisect_right(self.maxes, lo), len(self.blocks)):
+            block = self.blocks[b]
+            found.extend(block[bisect_right(block, lo):bisect_left(block, hi)])
+            if self.maxes[b] >= hi: break
+        return found
+
+class _CrossingIndex:
+    'Incremental count of prior days whose storage passed through a given level'
+
+    # Each day contributes the closed interval [low, high] between its starting and ending storage.
+    # Intervals entirely below st all have high < st, so the number of intervals containing st is
+    # the count of lows <= st minus the count of highs < st.  Both are sorted, so a query is two bisections.
+    def __init__(self):
+        self.lows = _SortedList()
+        self.highs = _SortedList()
+
+    def clear(self):
+        self.lows.clear()
+        self.highs.clear()
+
+    def copy(self):
+        other = _CrossingIndex()
+        other.lows, other.highs = self.lows.copy(), self.highs.copy()
+        return other
+
+    def add(self, s0, s1):
+        # record one day, storage s0 at its start and s1 at its end
+        if s0 > s1: s0, s1 = s1, s0
+        self.lows.insert(s0)
+        self.highs.insert(s1)
+
+    def count(self, st):
+        return self.lows.bisect_right(st) - self.highs.bisect_left(st)
+
+    def segments(self, lo, hi):
+        # Splits the levels between lo and hi where the count changes, listed from the top down
+        # Returns (top, bottom, count) tuples; count holds strictly between bottom and top
+        lows, highs = self.lows, self.highs
+        # going down, the count falls passing a day's low and rises passing a day's high
+        count = lows.bisect_left(hi) - highs.bisect_left(hi)
+        segments = []
+        for level, step in sorted([(v, -1) for v in lows.between(lo, hi)] + [(v, 1) for v in highs.between(lo, hi)], reverse=True):
+            segments.append((hi, level, count))
+            hi, count = level, count + step
+        segments.append((hi, lo, count))
+        return segments
+
+class _Season:
+    'Where compute_deltaS left off:  the next day to compute and the collection season state at that point'
+    __slots__ = ('next', 'beginning', 'maxSeasonalStorage', 'priorMaxSeasonalStorage', 'lowestEver', 'crossings')
+
+    def __init__(self):
+        self.next = 0
+        self.beginning = self.maxSeasonalStorage = self.priorMaxSeasonalStorage = self.lowestEver = None
+        self.crossings = _CrossingIndex()  # days from the beginning of the season up to yesterday
+
+    def copy(self):
+        other = _Season()
+        for name in self.__slots__: setattr(other, name, getattr(self, name))
+        other.crossings = self.crossings.copy()
+        return other
 
 class Handler:
 
     # initialize
-    def __init__(self, station_id, handle_init=True, volume_limit=0):
+    # drawdown='sampled' classifies each decreasing day in 2 or 20 equal parts, as always done;
+    # drawdown='exact' splits it at the levels where the classification actually changes
+    def __init__(self, station_id, handle_init=True, volume_limit=0, window=30, drawdown='sampled'):
         self.volume_limit = volume_limit
         self.HANDLE_INIT = handle_init
         self.station_id = station_id
+        self.window = window
+        assert drawdown in ('sampled', 'exact')
+        self.drawdown = drawdown
+        self.season_start = None  # (month, day) once set_beginnings is called
+        self._season = None
+
+    def set_window(self, days):
+        # Length of the 30-day rule window, for sensitivity runs
+        assert days >= 2
+        self.window = days
 
     def set_volume_limit(self, limit):
         # Usually set to volume at spillway; no collection above this
@@ -33,32 +333,39 @@ class Handler:
         return dt.year
 
     def get_right_limit(self):
-        from datetime import date
         #no! from dateutil.relativedelta import relativedelta
-        dt = self._storage[0][-1].astype(date) #no! + relativedelta(months=1)
-        return np.datetime64(dt.isoformat(), 'D')
+        return self._storage[0][-1].astype('datetime64[D]') #no! + relativedelta(months=1)
+
+    @property
+    def subdaily(self):
+        # True for records with times of day, such as hourly observations; see StorageRecord
+        return self._storage.dates.dtype != np.dtype('datetime64[D]')
         
     def extend_end(self):
         # Not for general use.
         # This extends the storage record out 31 days artificially.
         # It just takes the final value and duplicates it
         # This enables calculating a "draft version" of the analysis before you have T+30 days available
-        dates = [self._storage[0][-1]+np.timedelta64(i,'D') for i in range(1,31)]
-        storage = [self._storage[1][-1]] * 30
-        flags = np.zeros(30, dtype=np.int8)
-        self._storage = np.append(self._storage, [dates,storage,flags], axis=1)
+        w = self.window
+        dates = self._storage[0][-1] + np.arange(1, w+1).astype('timedelta64[D]')
+        storage = np.full(w, self._storage[1][-1])
+        self._storage.append(dates, storage)
 
     def set_beginnings(self, month=10, day=1):
-        from datetime import date
-        for i in range(len(self._storage[0])):
-            dt = self._storage[0][i].astype(date)
-            if dt.month == month and dt.day == day:
-                # set the "beginning" flag
-                self._storage[2][i] |= 4
+        self.season_start = (month, day)
+        self._flag_beginnings(0)
+
+    def _flag_beginnings(self, first):
+        # set the "beginning" flag, on the first observation of the day
+        days = self._storage[0][max(0, first-1):].astype('datetime64[D]')
+        hit = season_beginnings(days, *self.season_start)
+        hit[1:] &= days[1:] != days[:-1]
+        self._storage[2][first:][hit[1:] if first > 0 else hit] |= 4
 
     # This function supports identifying withdrawal of initial diversion to storage
     # Returns True if the reservoir passed through this elevation on zero or one prior days
     # since the beginning of the refill season
+    # Reference linear scan; compute_deltaS answers the same question from a _CrossingIndex
     def _hit_once(self, beginning, ind, st):
         ts = self._storage[1]
         if ind==0 or ind>len(ts): return False
@@ -66,32 +373,189 @@ class Handler:
         for i in range(beginning, ind):
             if ts[i] <= st <= ts[i+1] or ts[i] >= st >= ts[i+1]: 
                 hitcount += 1
-                if hitcount > 1: return False
+                if hitcount > 1:
+                    instrument.count('_hit_once iterations', i - beginning + 1)
+                    return False
+        instrument.count('_hit_once iterations', ind - beginning)
         return hitcount <= 1
 
 
+    # Exact classification of a decrease in storage from s_begin down to s_end, the limit of the
+    # sampled classification as the number of parts grows.  Working down from s_begin, a level the
+    # reservoir passed at most once this season (hit_once) is withdrawal, prereg until the first level
+    # that is regulation and after it below; other levels above low_behind, the lowest storage of the
+    # look-back window, are regulation, and the rest are withdrawal_after.
+    # Returns (withdrawal_prereg, regulation, withdrawal_after), each <= 0
+    def _split_drawdown(self, crossings, hit_ok, s_begin, s_end, low_behind):
+        drop = s_begin - s_end
+        if not hit_ok:
+            reg = max(0.0, s_begin - max(s_end, low_behind))
+            return 0.0, -reg, reg - drop
+        prereg = reg = after = 0.0
+        for top, bottom, count in crossings.segments(s_end, s_begin):
+            if count <= 1:
+                if reg > 0:  # some regulation already happened today
+                    after += top - bottom
+                else:
+                    prereg += top - bottom
+            else:
+                above = max(0.0, top - max(bottom, low_behind))
+                reg += above
+                after += top - bottom - above
+        return -prereg, -reg, -after
+
     # Compute collection and withdrawal using the 30-day rule
-    # Pass a numpy array with three columns:  obs_date, storage starting that date, and an integer
+    # Works on self._storage, a StorageRecord with three columns:  obs_date, storage starting that date, and an integer
     # The integer has 4 bit flags, as documented in the book:
     #   bit 0:  strikeout, if set, skip processing this date
     #   bit 1:  (formerly italic) is not used anymore
     #   bit 2:  bold, if set, reset to start of collection period
-    def compute_deltaS(self):
-
-        storage = self._storage
-
-        length = len(storage[0])
-        collection_refill = np.zeros(length)
-        withdrawal_after = np.zeros(length)
-        regulation = np.zeros(length)
-        collection_init = np.zeros(length)
-        withdrawal_prereg = np.zeros(length)
-        calcs = np.zeros(length)
-
-        for ind in range(length-0-31):  # WAS:  -1
-            storage_begin = storage[1][ind]  # for brevity and to avoid typographical errors in code
-            storage_end = storage[1][ind+1]  # for brevity and to avoid typographical errors in code
-            when = storage[0][ind]
+    def rolling_minimums(self):
+        # Returns (ahead, behind):  for each day ind, the lowest storage on the window days
+        # following it, ind+1 through ind+window, and on the window-1 days preceding it.
+        # Near the ends of the record the windows are truncated, as slicing would.
+        # For sub-daily records the windows are spans of time:  after each observation through
+        # window days later, and from window-1 days before it.
+        if self.subdaily:
+            return _time_window_minimums(self._storage.dates, self._storage.storage, self.window, 0, len(self._storage))
+        return _window_minimums(self._storage.storage, self.window, 0, len(self._storage))
+
+    def _final_stop(self):
+        # The number of leading days, or observations, with a complete look-ahead window; all but the last window+1 days
+        length = len(self._storage)
+        if not self.subdaily or length == 0: return length-0-(self.window+1)  # WAS:  -1
+        t = self._storage.dates
+        return int(np.searchsorted(t, t[-1] - np.timedelta64(self.window+1, 'D'), 'right'))
+
+    def daily(self):
+        'Results summed by day; for a daily record, cwr itself'
+        if not self.subdaily: return self.cwr
+        days = self.cwr.dates.astype('datetime64[D]')
+        first = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1]))) if len(days) else np.array([], dtype=int)
+        return DailyResults(days[first], np.add.reduceat(self.cwr.values, first, axis=1) if len(days) else self.cwr.values)
+
+    # Computes every day with a complete look-ahead window, through the 32nd to last day.
+    # With provisional=True the remaining days, but the last, are computed as a draft, as if
+    # storage stayed at its last value (see extend_end), and flagged in self.provisional
+    # With workers > 1, a long record is split into runs of whole collection seasons computed on
+    # that many processes; the results are the same.
+    # minimums may pass in rolling_minimums() of another handler with the same storage and window.
+    @instrument.timed('compute_deltaS')
+    def compute_deltaS(self, provisional=False, workers=1, minimums=None):
+        length = len(self._storage)
+        stop = self._final_stop()
+        self.cwr = DailyResults(self._storage.dates.copy(), np.zeros((len(DailyResults.COLUMNS), length)))
+        self._season = _Season()
+        chunks = self._season_chunks(stop, workers)
+        if len(chunks) > 1:
+            # all but the last run go to the pool; the last one is computed here, keeping its state for append
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [(lo, hi, pool.submit(_season_chunk, self._chunk_args(lo, hi))) for lo, hi in chunks[:-1]]
+                self._season.next = chunks[-1][0]
+                self._advance(self._season, stop, minimums=minimums)
+                for lo, hi, future in futures:
+                    self.cwr.values[:, lo:hi] = future.result()
+        else:
+            self._advance(self._season, stop, minimums=minimums)
+        self._draft(provisional)
+
+    # Every day flagged as a season beginning, struck out or not, resets all the state the daily loop
+    # carries, so the record can be cut there.  Returns up to workers (first, stop) runs of days,
+    # each made of whole seasons and about equal in length.
+    def _season_chunks(self, stop, workers):
+        flags = self._storage.flags[:max(0, stop)]
+        cuts = np.flatnonzero(flags & 4)
+        cuts = cuts[cuts > 0]
+        if workers <= 1 or len(cuts) == 0: return [(0, stop)]
+        picks = np.searchsorted(cuts, stop * np.arange(1, workers) / workers)
+        bounds = sorted({0, stop, *cuts[picks[picks < len(cuts)]].tolist()})
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _chunk_args(self, lo, hi):
+        # the days lo..hi-1 plus the look-back and look-ahead windows around them
+        w = self.window
+        a, b = max(0, lo-(w-1)), min(len(self._storage), hi+w+1)
+        if self.subdaily:
+            t = self._storage.dates
+            a = int(np.searchsorted(t, t[lo] - np.timedelta64(w-1, 'D')))
+            b = min(len(t), int(np.searchsorted(t, t[hi-1] + np.timedelta64(w, 'D'), 'right')) + 1)
+        params = (self.station_id, self.HANDLE_INIT, self.volume_limit, w, self.drawdown)
+        return params, self._storage.dates[a:b], self._storage.storage[a:b], self._storage.flags[a:b], lo-a, hi-a
+
+    # For daily updates during the season:  adds observations at the end of the record and computes
+    # only the days whose look-ahead window reaches them, continuing from the saved season state.
+    # Final days come out identical to a full compute_deltaS; the rest are redone as a draft.
+    @instrument.timed('append')
+    def append(self, dates, storage, flags=None, provisional=True):
+        dates = np.asarray(dates).astype(self._storage.dates.dtype)
+        if len(dates) == 0: return
+        if self.subdaily:
+            assert dates[0] > self._storage[0][-1], 'observations must continue the record'
+        else:
+            assert dates[0] == self._storage[0][-1] + np.timedelta64(1, 'D'), 'observations must continue the record'
+        first_new = len(self._storage)
+        self._storage.append(dates, storage, flags)
+        if self.season_start is not None: self._flag_beginnings(first_new)
+        if self._season is None:
+            # nothing computed yet, or results loaded from a ResultCache without the season state
+            if hasattr(self, 'cwr'): self.compute_deltaS(provisional)
+            return
+
+        length = len(self._storage)
+        done = self._season.next
+        values = np.zeros((len(DailyResults.COLUMNS), length))
+        values[:, :done] = self.cwr.values[:, :done]
+        self.cwr = DailyResults(self._storage.dates.copy(), values)
+        self._advance(self._season, self._final_stop())
+        self._draft(provisional)
+
+    def _draft(self, provisional):
+        # draft results for the days after the last final one, on storage extended flat past the end
+        length = len(self._storage)
+        self.provisional = np.zeros(length, dtype=bool)
+        first = self._season.next
+        if not provisional or first >= length-1: return
+        w = self.window
+        ts = self._storage.storage.tolist() + [self._storage[1][-1]] * w
+        flags = self._storage.flags.tolist() + [0] * w
+        times = None
+        if self.subdaily:
+            times = np.concatenate((self._storage.dates, self._storage[0][-1] + np.arange(1, w+1).astype('timedelta64[D]')))
+        self._advance(self._season.copy(), length-1, ts, flags, times=times)
+        self.provisional[first:length-1] = True
+
+    # The daily loop of compute_deltaS.  Computes days season.next through stop-1 into self.cwr,
+    # carrying the collection season state along in season.  ts and flags default to the storage record,
+    # and minimums, if given, are its rolling_minimums().  times are the observation times of ts, for
+    # sub-daily records.
+    def _advance(self, season, stop, ts=None, flags=None, minimums=None, times=None):
+
+        w = self.window
+        first = season.next
+        if ts is None: ts, flags = self._storage.storage, self._storage.flags
+        if times is None and self.subdaily: times = self._storage.dates
+        with instrument.timer('window minimums'):
+            if minimums is None and times is not None:
+                minimums = _time_window_minimums(times, ts, w, first, max(first, stop))
+            elif minimums is None:
+                minimums = _window_minimums(ts, w, first, max(first, stop))
+            else:
+                minimums = (m[first:max(first, stop)] for m in minimums)
+            # the daily loop reads Python floats and ints rather than indexing numpy scalars
+            ahead, behind = (m.tolist() for m in minimums)
+            ts, flags = (x.tolist() if isinstance(x, np.ndarray) else x for x in (ts, flags))
+        drawdown_days = drawdown_parts = crossing_lookups = 0  # tallies for instrument
+
+        collection_refill, withdrawal_after, regulation, collection_init, withdrawal_prereg, calcs = self.cwr.values
+        crossings = season.crossings
+        beginning, maxSeasonalStorage = season.beginning, season.maxSeasonalStorage
+        priorMaxSeasonalStorage, lowestEver = season.priorMaxSeasonalStorage, season.lowestEver
+
+        for ind in range(first, stop):
+            if ind > 0:
+                crossings.add(ts[ind-1], ts[ind])
+            storage_begin = ts[ind]  # for brevity and to avoid typographical errors in code
+            storage_end = ts[ind+1]  # for brevity and to avoid typographical errors in code
 
             # disregard activity above the volume limit
             if self.volume_limit > 0:
@@ -101,19 +565,22 @@ class Handler:
             # calculate change in storage during today's date
             deltaStotal = storage_end - storage_begin
 
-            # Look for the "strikeout" flag:  no storage or collection today
-            if storage[2][ind] & 1:
-                regulation[ind] = deltaStotal
-                continue
-
             # Look for the "bold" flag:  reset the initial storage, start of collection season
-            # The first data point evaluated also resets it
-            if ind==0 or storage[2][ind] & 4:
+            # The first data point evaluated also resets it, and so does a struck-out beginning
+            if ind==0 or flags[ind] & 4:
                 beginning = ind
-                maxSeasonalStorage = storage[1][ind]
+                crossings.clear()
+                maxSeasonalStorage = ts[ind]
                 priorMaxSeasonalStorage = maxSeasonalStorage
                 lowestEver = maxSeasonalStorage
 
+            # Look for the "strikeout" flag:  no storage or collection today
+            # The seasonal maximum still follows storage, so a struck-out rise is not collected later on
+            if flags[ind] & 1:
+                regulation[ind] = deltaStotal
+                maxSeasonalStorage = max(maxSeasonalStorage, storage_end)
+                continue
+
             # Handle increase in storage this day
             if deltaStotal > 0:
                 lowestEver = min(lowestEver, storage_begin)
@@ -132,7 +599,7 @@ class Handler:
                 # We are only examining the portion which was refill
 
                 # Will we be releasing at least some of today's refill within a month?
-                hit_storage = min(storage[1][ind+1 : ind+min(31, len(storage[1]))])
+                hit_storage = ahead[ind-first]  # min(ts[ind+1 : ind+w+1])
                 if hit_storage < storage_end:
                     # yes, some or all of today's storage is regulation
                     regulation_start = max(hit_storage, storage_begin)
@@ -142,6 +609,12 @@ class Handler:
                 assert collection_refill[ind] >= 0
 
             # Handle decrease in storage this day
+            elif deltaStotal < 0 and self.drawdown == 'exact':
+                drawdown_days += 1
+                withdrawal_prereg[ind], regulation[ind], withdrawal_after[ind] = self._split_drawdown(
+                    crossings, self.HANDLE_INIT and ind > 0, storage_begin, storage_end, behind[ind-first])
+                assert abs(deltaStotal - (withdrawal_after[ind] + withdrawal_prereg[ind] + regulation[ind])) < .01
+
             elif deltaStotal < 0:
 
                 # divide into segments, analyze each one separately classify each
@@ -150,16 +623,20 @@ class Handler:
                 else:
                     parts = 20
                 deltaSpart = deltaStotal/parts
+                drawdown_days += 1
+                drawdown_parts += parts
+                if self.HANDLE_INIT and ind > 0: crossing_lookups += parts
                 for st in np.linspace(storage_begin, storage_end, parts+1)[1:]:
                     # (1) see if st has a hit_once.  If so, it's some kind of withdrawal 
                     # (2) else, apply the 30 day rule.  If so, it's all regulation
                     # (3) else, it's wd2 (post-regulation withdrawal)
-                    if self._hit_once(beginning, ind, st) and self.HANDLE_INIT:
+                    # equivalent to self._hit_once(beginning, ind, st)
+                    if self.HANDLE_INIT and ind > 0 and crossings.count(st) <= 1:
                         if regulation[ind] < 0:  # meaning, some regulation already happened today
                             withdrawal_after[ind] += deltaSpart
                         else:
                             withdrawal_prereg[ind] += deltaSpart
-                    elif ind>0 and min(storage[1][ind-min(29, ind) : ind]) < st:
+                    elif ind>0 and behind[ind-first] < st:  # min(ts[ind-min(w-1, ind) : ind])
                         regulation[ind] += deltaSpart
                     else:
                         withdrawal_after[ind] += deltaSpart
@@ -171,7 +648,7 @@ class Handler:
             else:
                 pass # no change in storage today, just leave result arrays with zero
 
-            #print(withdrawal_after[ind], collection_refill[ind], regulation[ind], storage[2][ind] & 2)
+            #print(withdrawal_after[ind], collection_refill[ind], regulation[ind], flags[ind] & 2)
 
             # At least one of these must be zero every day
             assert withdrawal_after[ind] * collection_refill[ind] == 0
@@ -183,7 +660,14 @@ class Handler:
                 print(withdrawal_after[ind], collection_refill[ind], regulation[ind], withdrawal_prereg[ind], collection_init[ind])
             assert abs(summation-deltaStotal) < .01
 
-        self.cwr = np.row_stack((storage[0], collection_refill, withdrawal_after, regulation, collection_init, withdrawal_prereg, calcs))
+        if instrument.active is not None:
+            instrument.count('days computed', max(0, stop - first))
+            instrument.count('drawdown days', drawdown_days)
+            instrument.count('drawdown parts', drawdown_parts)
+            instrument.count('crossing lookups', crossing_lookups)
+        season.next = max(first, stop)
+        season.beginning, season.maxSeasonalStorage = beginning, maxSeasonalStorage
+        season.priorMaxSeasonalStorage, season.lowestEver = priorMaxSeasonalStorage, lowestEver
 
     def summation(self):
         cwr = self.cwr
@@ -192,25 +676,39 @@ class Handler:
     def store_daily_json(self, f):
         import json
         from datetime import date
+        cwr = self.daily()
         cwr_dict = [{
-                'date': self.cwr[0][i].astype(date).strftime('%Y-%m-%d'),
-                'coll': round(self.cwr[1][i]+self.cwr[4][i],2),
-                'wd': round(-(self.cwr[2][i]+self.cwr[5][i]),2),
-                'reg': round(self.cwr[3][i],2)
-                } for i in range(len(self.cwr[1]))]
+                'date': cwr[0][i].astype(date).strftime('%Y-%m-%d'),
+                'coll': round(cwr[1][i]+cwr[4][i],2),
+                'wd': round(-(cwr[2][i]+cwr[5][i]),2),
+                'reg': round(cwr[3][i],2)
+                } for i in range(len(cwr[1]))]
         json.dump(cwr_dict, f, ensure_ascii=False, indent=2)
 
+def _season_chunk(args):
+    # Worker for Handler.compute_deltaS:  results for days first..stop-1 of a slice of the record
+    params, dates, storage, flags, first, stop = args
+    handler = Handler(*params)
+    handler._storage = StorageRecord(dates, storage, flags)
+    handler.cwr = DailyResults(handler._storage.dates, np.zeros((len(DailyResults.COLUMNS), len(dates))))
+    season = _Season()
+    season.next = first
+    handler._advance(season, stop)
+    return handler.cwr.values[:, first:stop]
+
 class Plotter:
     'Plots the collection, withdrawal, and regulation time series'
 
     def __init__(self, handler, res_name, station_id, wateryear):
         self.handler = handler
         self.title, self.subtitle = f'{res_name} Storage Analysis', f"{station_id}, water year {wateryear}",
+        plt = _pyplot()
         plt.rcParams['font.family'] = 'sans-serif'
         # To customize the font add entries here; example is for Windows 10
         # plt.rcParams['font.sans-serif'] = ['Barlow Condensed', 'Gill Sans MT']
         self.fig, self.ax = plt.subplots(figsize=(9.0, 5.5))
         
+    @instrument.timed('plot')
     def make_plot(self):
         'Populate the axes with information'
         from matplotlib.dates import MonthLocator, DateFormatter, YearLocator, DayLocator
@@ -238,75 +736,84 @@ class Plotter:
 
         # show spillway line, label it
         self.plot_limit_line()
+        if instrument.active is not None:
+            instrument.count('plot artists', len(self.fig.findobj()))
 
     # Plots time series of storage given daily collection and withdrawal
+    # Each day is drawn as up to three straight segments, in proportion to the time of day each
+    # part takes.  The segments are computed for all days at once and drawn as one LineCollection
+    # per color, rather than one line artist per segment.
+    # For sub-daily records each observation interval is drawn the same way, in minutes.
     def plot_ts(self, annotate=False):
-        initial = self.handler._storage[1][0]
-        current_storage = initial
-
-        for ind in range(len(self.handler.cwr[0])):
-            midnight = self.handler.cwr[0][ind]
-            collection_refill = self.handler.cwr[1][ind]
-            withdrawal_after = self.handler.cwr[2][ind]
-            regulation = self.handler.cwr[3][ind]
-            collection_init = self.handler.cwr[4][ind]
-            withdrawal_prereg = self.handler.cwr[5][ind]
-            calc = self.handler.cwr[6][ind]
-
-            ending_storage = current_storage + regulation + collection_refill + withdrawal_after + collection_init + withdrawal_prereg
-            total = abs(regulation) + abs(withdrawal_after) + abs(withdrawal_prereg) + collection_refill + collection_init
-            partday = lambda x: np.timedelta64(int(24*abs(x)), 'h')
-
-            if ending_storage > current_storage:
-                # Order is always:  collection_refill, regulation, collection_init
-
-                x = midnight, midnight + partday(collection_refill/total)
-                y = current_storage, current_storage + collection_refill
-                if calc>0 and annotate:  self.ax.annotate(f'{calc:.0f}', (x[0],y[0]), fontsize=6)
-                if collection_refill > 0:
-                    self.ax.plot(x, y, color='darkgreen')
-
-                x = x[1], x[1] + partday(regulation/total)
-                y = y[1], y[1] + regulation
-                # no plot, do nothing
-
-                x = x[1], x[1] + partday(collection_init/total)
-                y = y[1], y[1] + collection_init
-                if collection_init > 0:
-                    self.ax.plot(x, y, color='darkgreen')
-
-            elif ending_storage < current_storage:
-                order = (withdrawal_prereg, regulation, withdrawal_after)
-                colors = ('darkgreen','none','darkgreen')
-
-
-                x = midnight, midnight
-                y = current_storage, current_storage
-                if annotate:  self.ax.annotate(f'{calc:.0f}', (x[0],y[0]), fontsize=6)
-
-                x = x[1], x[1] + partday(order[0]/total)
-                y = y[1], y[1] + order[0]
-                if order[0] != 0: self.ax.plot(x, y, color=colors[0])
-
-                x = x[1], x[1] + partday(order[1]/total)
-                y = y[1], y[1] + order[1]
-                if order[1] != 0: self.ax.plot(x, y, color=colors[1])
-
-                x = x[1], x[1] + partday(order[2]/total)
-                y = y[1], y[1] + order[2]
-                if order[2] != 0: self.ax.plot(x, y, color=colors[2])
-
-
-            current_storage = ending_storage
+        from matplotlib.collections import LineCollection
+        from matplotlib.dates import date2num
+        plt = _pyplot()
+        cwr = self.handler.cwr
+        unit = 'm' if self.handler.subdaily else 'h'
+        midnight = cwr[0].astype(f'datetime64[{unit}]')
+        span = 24
+        if self.handler.subdaily:
+            span = np.diff(midnight).astype(float)
+            span = np.append(span, span[-1] if len(span) else 1440)
+        collection_refill, withdrawal_after, regulation, collection_init, withdrawal_prereg, calc = (cwr[i] for i in range(1, 7))
+
+        change = regulation + collection_refill + withdrawal_after + collection_init + withdrawal_prereg
+        current_storage = self.handler._storage[1][0] + np.concatenate(([0], np.cumsum(change)[:-1]))
+        ending_storage = current_storage + change
+        total = abs(regulation) + abs(withdrawal_after) + abs(withdrawal_prereg) + collection_refill + collection_init
+        with np.errstate(divide='ignore', invalid='ignore'):
+            partday = lambda x: np.nan_to_num(span*abs(x/total)).astype(int).astype(f'timedelta64[{unit}]')
+
+            up = ending_storage > current_storage
+            down = ending_storage < current_storage
+            # Order when rising is always:  collection_refill, regulation, collection_init
+            # Order when falling is always:  withdrawal_prereg, regulation, withdrawal_after
+            first = np.where(up, collection_refill, withdrawal_prereg)
+            last = np.where(up, collection_init, withdrawal_after)
+            t1 = midnight + partday(first)
+            t2 = t1 + partday(regulation)
+            t3 = t2 + partday(last)
+        s1 = current_storage + first
+        s2 = s1 + regulation
+        s3 = s2 + last
+
+        segments = {'darkgreen': []}
+        for shown, x0, x1, y0, y1 in (
+                (up & (first > 0) | down & (first != 0), midnight, t1, current_storage, s1),
+                (up & (last > 0) | down & (last != 0), t2, t3, s2, s3)):
+            x = date2num(np.stack((x0[shown], x1[shown]), axis=-1))
+            y = np.stack((y0[shown], y1[shown]), axis=-1)
+            segments['darkgreen'].append(np.stack((x, y), axis=-1))
+        for color, segs in segments.items():
+            lines = LineCollection(np.concatenate(segs), colors=color, linewidths=plt.rcParams['lines.linewidth'],
+                                   capstyle=plt.rcParams['lines.solid_capstyle'], joinstyle=plt.rcParams['lines.solid_joinstyle'], zorder=2)
+            self.ax.add_collection(lines)
+        self.ax.autoscale_view()
+
+        if annotate:
+            for ind in np.flatnonzero(up & (calc > 0) | down):
+                self.ax.annotate(f'{calc[ind]:.0f}', (midnight[ind], current_storage[ind]), fontsize=6)
+
+    def close(self):
+        'Releases the figure'
+        _pyplot().close(self.fig)
+
+    @instrument.timed('plot write')
+    def save(self, path, format=None):
+        'Saves the figure, in the format given by the file extension, or by format (for a file object)'
+        # PNG is written with light compression, which is faster than SVG for batch jobs
+        png = format == 'png' if format else str(path).lower().endswith('.png')
+        kwargs = {'pil_kwargs': {'compress_level': 1}} if png else {}
+        if format: kwargs['format'] = format
+        self.fig.savefig(path, **kwargs)
 
     def plot_basic(self, marker='o', markersize=1):
         self.ax.plot(self.handler._storage[0], self.handler._storage[1], color='#909090', linewidth = .5, marker=marker, markersize=markersize)
 
     def plot_beginnings(self):
         if self.handler.HANDLE_INIT:
-            for i in range(len(self.handler._storage[0])):
-                if self.handler._storage[2][i] & 4:
-                    self.ax.axvline(self.handler._storage[0][i], color='k')
+            for beginning in self.handler._storage[0][self.handler._storage[2] & 4 != 0]:
+                self.ax.axvline(beginning, color='k')
         else:
             left,right = self.ax.get_xlim()
             top,bottom = self.ax.get_ylim()
@@ -320,47 +827,107 @@ class Plotter:
             self.ax.annotate(f"{vl:,.0f}", (left, vl))
 
 
+def period_starts(dates, period='month'):
+    'Start date of the reporting period containing each date, and the start of the period after it'
+    # period is 'month', 'week' (starting Mondays), 'wateryear' (starting October 1), or a sorted
+    # sequence of boundary dates for custom periods, each running up to the next boundary.
+    # Dates outside custom boundaries get NaT.
+    days = np.asarray(dates, dtype='datetime64[D]')
+    if isinstance(period, str):
+        if period == 'month':
+            months = days.astype('datetime64[M]')
+            return months.astype('datetime64[D]'), (months + 1).astype('datetime64[D]')
+        if period == 'week':
+            # 1970-01-05, day 4, was a Monday
+            monday = (days.astype(np.int64) - 4) // 7 * 7 + 4
+            return monday.astype('datetime64[D]'), (monday + 7).astype('datetime64[D]')
+        if period == 'wateryear':
+            october = ((days.astype('datetime64[M]') + 3).astype('datetime64[Y]').astype('datetime64[M]') - 3)
+            return october.astype('datetime64[D]'), (october + 12).astype('datetime64[D]')
+        raise ValueError(f'Unknown reporting period {period}')
+    bounds = np.append(np.asarray(period, dtype='datetime64[D]'), np.datetime64('NaT'))
+    i = np.searchsorted(bounds[:-1], days, side='right') - 1
+    start, end = bounds[i], bounds[i+1]
+    start[(i < 0) | np.isnat(end)] = np.datetime64('NaT')
+    return start, end
+
+def complete_periods(dates, period='month'):
+    'Returns (first, start, end):  index of the first day, start date, and end date of each complete period in dates'
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    start, end = period_starts(dates, period)
+    if len(dates):
+        first = np.flatnonzero(np.concatenate(([True], start[1:] != start[:-1])))
+        complete = (start[first] >= dates[0]) & (end[first] <= dates[-1] + np.timedelta64(1, 'D'))
+        first = first[complete]
+    else:
+        first = np.array([], dtype=int)
+    return first, start[first], end[first]
+
+def period_sums(values, first, stop):
+    'Sums values along the last axis over each period, from index first[i] up to the next, the last up to stop'
+    # Days are added one at a time, in the order of the per-month loop Monthlies replaced, so
+    # totals falling at .5 round as they always have; the same day of every period is added at once.
+    days = np.diff(np.append(first, stop))
+    totals = np.zeros(values.shape[:-1] + (len(first),))
+    for day in range(days.max() if len(first) else 0):
+        live = days > day
+        totals[..., live] += values[..., first[live] + day]
+    return totals
+
 class Monthlies:
     "Utility for tabulating monthly diversion and withdrawal"
 
-    def __init__(self, handler):
-        # Returns an np array with month, collection, and withdrawal totals
-        import calendar
-        from datetime import date
-
-        # only compute months for which our record is complete
-        dt = [d.astype(date) for d in handler.cwr[0]]
-        for start in range(len(dt)):
-            if dt[start].day == 1: break
-        ##print(f'Starting at {start}, {dt[start]}')
-        for end in range(len(dt)-1, len(dt)-31, -1):
-            daysin = calendar.monthrange(dt[end].year, dt[end].month)[1]
-            if dt[end].day == daysin: break
-        ##print(f'Ending at {end}, {dt[end]}')
-
-        ym = []  # date of start of month
-        cl = []  # monthly total collection (+)
-        wd = []  # monthly total withdrawal (-)
-        re = []  # monthly total net regulation (+ or -)
+    # Totals are computed for every complete reporting period in the record, by default calendar
+    # months.  Pass period='week', 'wateryear', or a list of boundary dates for other periods;
+    # see period_starts().
+    @instrument.timed('period totals')
+    def __init__(self, handler, period='month'):
+        # Sets self.start and self.end (dates, end exclusive) and self.collection,
+        # self.withdrawal, and self.regulation totals for each period
+        self.period = period
+        # only compute periods for which our record is complete
+        daily = handler.daily()
+        first, self.start, self.end = complete_periods(daily[0], period)
+        lo = first[0] if len(first) else 0
+        hi = np.searchsorted(daily[0], self.end[-1]) if len(first) else 0
+
+        # every column summed over every period at once
+        cwr = daily.values[:, lo:hi]
+        totals = period_sums(cwr, first - lo, hi - lo)
+        self.collection = totals[0] + totals[3]   # total collection (+)
+        self.withdrawal = totals[1] + totals[4]   # total withdrawal (-)
+        self.regulation = totals[2]               # total net regulation (+ or -)
                  # regulation will be included as either direct diversion or available for free for rediversion later
-        ind = start
-        while ind <= end:
-            assert dt[ind].day == 1
-            y, m = dt[ind].year, dt[ind].month
-            ym.append(np.datetime64(f'{y:04d}-{m:02d}-01'))
-            daysin = calendar.monthrange(dt[ind].year, dt[ind].month)[1]
-            total = lambda i: sum(handler.cwr[i][ind:ind+daysin])
-            cl.append(total(1) + total(4))
-            wd.append(total(2) + total(5))
-            re.append(total(3))
-            ind += daysin
 
         # DEBUG
-        checksum1 = sum(handler.cwr[1][start:end+1]+handler.cwr[2][start:end+1]+handler.cwr[3][start:end+1]+handler.cwr[4][start:end+1]+handler.cwr[5][start:end+1])
-        checksum2 = sum(cl+wd+re)
+        checksum1 = (cwr[0] + cwr[1] + cwr[2] + cwr[3] + cwr[4]).sum()
+        checksum2 = (self.collection + self.withdrawal + self.regulation).sum()
         assert abs(checksum1 - checksum2) < .1
 
-        self.monthlies = np.array([ym,cl,wd,re])
+    @classmethod
+    def from_totals(cls, period, start, end, collection, withdrawal, regulation):
+        'Monthlies from totals computed earlier, as saved by resultcache.ResultCache'
+        self = cls.__new__(cls)
+        self.period = period
+        self.start, self.end = start, end
+        self.collection, self.withdrawal, self.regulation = collection, withdrawal, regulation
+        return self
+
+    @property
+    def monthlies(self):
+        # period start, collection, withdrawal, and regulation, as rows
+        return (self.start, self.collection, self.withdrawal, self.regulation)
+
+    def label(self, ind):
+        'Short name of the period for tables:  month abbreviation, WY and year, or month-day'
+        if self.period == 'month':
+            return self.start[ind].astype(date).strftime('%b')
+        if self.period == 'wateryear':
+            return f'WY{self.end[ind].astype(date).year}'
+        return self.start[ind].astype(date).strftime('%m-%d')
+
+    def heading(self):
+        return {'month': 'Month', 'week': 'Week', 'wateryear': 'Year'}.get(self.period, 'Period') if isinstance(self.period, str) else 'Period'
 
     def plot_tabulate(self, ax):
         # Make room for and print the storage and collection time series
@@ -369,11 +936,12 @@ class Monthlies:
         ax.set_ylim(bottom=bottom-(top-bottom)/8)
         left, right = ax.get_xlim()
         ax.set_xlim(left = left - np.timedelta64(31, 'D').astype(float))
-        ax.annotate('Month:\nColl:\nWthdrl:\nReg:', (left,bottom), fontsize=8, ha='right', va='top', color='k')
-        for ind in range(len(self.monthlies[0])):
-            ym = self.monthlies[0][ind] + np.timedelta64(27, 'D')
-            mon = self.monthlies[0][ind].astype(date).strftime('%b')
-            col, wd, reg = self.monthlies[1][ind], self.monthlies[2][ind], self.monthlies[3][ind]
+        ax.annotate(f'{self.heading()}:\nColl:\nWthdrl:\nReg:', (left,bottom), fontsize=8, ha='right', va='top', color='k')
+        for ind in range(len(self.start)):
+            # months are labeled at day 28, other periods at their last day
+            ym = self.start[ind] + np.timedelta64(27, 'D') if self.period == 'month' else self.end[ind] - np.timedelta64(1, 'D')
+            mon = self.label(ind)
+            col, wd, reg = self.collection[ind], self.withdrawal[ind], self.regulation[ind]
             col_wd_reg = f"{mon} \n{col:.0f} \n{-wd+.01:.0f} \n"
             if reg >= 0:
                 col_wd_reg += f"{reg:.0f} "
@@ -384,29 +952,30 @@ class Monthlies:
     def text_tabulate(self, f):
         # T account style listing
         #         123456781234567812345678
-        header = 'Month      Debit  Credit\n'
+        header = f"{self.heading():8s}{'Debit':>8s}{'Credit':>8s}\n"
         f.write('Collection to storage and withdrawal\n')
         f.write(header)
-        for ind in range(len(self.monthlies[0])):
-            mon = self.monthlies[0][ind].astype(date).strftime('%b')
-            col, wd, reg = self.monthlies[1][ind], self.monthlies[2][ind], self.monthlies[3][ind]
-            f.write(f'{mon}     {col:8.0f}{-wd:8.0f}\n')
+        for ind in range(len(self.start)):
+            mon = self.label(ind)
+            col, wd, reg = self.collection[ind], self.withdrawal[ind], self.regulation[ind]
+            f.write(f'{mon:8s}{col:8.0f}{-wd:8.0f}\n')
         f.write('\n')
         f.write('Regulation, as direct diversion(+) and as use(–)\n')
         f.write(header)
-        for ind in range(len(self.monthlies[0])):
-            mon = self.monthlies[0][ind].astype(date).strftime('%b')
-            col, wd, reg = self.monthlies[1][ind], self.monthlies[2][ind], self.monthlies[3][ind]
+        for ind in range(len(self.start)):
+            mon = self.label(ind)
+            reg = self.regulation[ind]
             if reg>0:
                 dr, cr = reg,0
             else:
                 dr, cr = 0, -reg
-            f.write(f'{mon}     {dr:8.0f}{cr:8.0f}\n')
+            f.write(f'{mon:8s}{dr:8.0f}{cr:8.0f}\n')
 
     def plot_bar(self, ax):
         # upward bars for collection, downward for withdrawal, plus additional for regulation
-        for item in (self.monthlies[1], self.monthlies[2]):
-            p = ax.bar(self.monthlies[0],item, width=np.timedelta64(30, 'D'), align='edge', color='tab:blue')
+        width = np.timedelta64(30, 'D') if self.period == 'month' else self.end - self.start
+        for item in (self.collection, self.withdrawal):
+            p = ax.bar(self.start,item, width=width, align='edge', color='tab:blue')
             #ax.bar_label(p, label_type='center', padding=12)
         ax.axhline(0, color='k')
         ax.spines.right.set_visible(False)
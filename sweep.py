@@ -0,0 +1,121 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Comparison of the 30-day rule classification under several interpretations
+# A sweep computes one storage record under every combination of volume limit, handle_init,
+# season start, and window length.  The record is sent once to each worker process, and the
+# rolling minimums, which depend only on the storage and the window, are computed once per window.
+# The result is a table with one row per scenario and period:  monthly totals, then water-year totals.
+import sys, argparse, itertools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+from storagehandler import Handler, StorageRecord, Monthlies
+import cdecpuller, exporters
+from cdeccache import CdecCache
+from archive import ArchiveAdapter
+
+FIELDS = [('scenario', 'i4'), ('volume_limit', 'f8'), ('handle_init', 'i1'), ('season_month', 'i1'), ('season_day', 'i1'),
+          ('window', 'i2'), ('period', 'U9'), ('start', 'datetime64[D]'), ('end', 'datetime64[D]'),
+          ('collection', 'f8'), ('withdrawal', 'f8'), ('regulation', 'f8')]
+
+def scenarios(volume_limits=(0,), handle_init=(True,), season_starts=((10, 1),), windows=(30,)):
+    'Every combination of the given settings, as a list of dicts'
+    return [dict(volume_limit=v, handle_init=h, season_start=tuple(s), window=w)
+            for v, h, s, w in itertools.product(volume_limits, handle_init, season_starts, windows)]
+
+# The record, and its rolling minimums by window, in each worker process
+_record = None
+
+def _load(dates, storage, flags, minimums):
+    global _record
+    _record = dates, storage, flags, minimums
+
+def _run(scenario, drawdown):
+    dates, storage, flags, minimums = _record
+    handler = Handler('', handle_init=scenario['handle_init'], volume_limit=scenario['volume_limit'],
+                      window=scenario['window'], drawdown=drawdown)
+    handler._storage = StorageRecord(dates, storage, flags)
+    handler.set_beginnings(*scenario['season_start'])
+    handler.compute_deltaS(minimums=minimums[scenario['window']])
+    return Monthlies(handler, 'month'), Monthlies(handler, 'wateryear')
+
+def _table(runs, results):
+    parts = []
+    for i, (scenario, periods) in enumerate(zip(runs, results)):
+        for totals in periods:
+            rows = np.empty(len(totals.start), dtype=FIELDS)
+            rows['scenario'], rows['volume_limit'], rows['handle_init'] = i, scenario['volume_limit'], scenario['handle_init']
+            rows['season_month'], rows['season_day'] = scenario['season_start']
+            rows['window'], rows['period'] = scenario['window'], totals.period
+            rows['start'], rows['end'] = totals.start, totals.end
+            rows['collection'], rows['withdrawal'], rows['regulation'] = totals.collection, totals.withdrawal, totals.regulation
+            parts.append(rows)
+    return np.concatenate(parts) if parts else np.empty(0, dtype=FIELDS)
+
+def sweep(dates, storage, runs, flags=None, drawdown='sampled', workers=1):
+    'Computes the record under each of the scenarios in runs.  Returns the comparison table, a structured array'
+    # season beginnings come from each scenario, so any in flags are dropped
+    flags = np.zeros(len(dates), dtype=np.int8) if flags is None else np.asarray(flags, dtype=np.int8) & ~4
+    minimums = {}
+    for w in sorted({scenario['window'] for scenario in runs}):
+        handler = Handler('', window=w)
+        handler._storage = StorageRecord(dates, storage)
+        minimums[w] = handler.rolling_minimums()
+    shared = (handler._storage.dates, np.asarray(storage, dtype=np.float64), flags, minimums)
+    if workers == 1:
+        _load(*shared)
+        results = [_run(scenario, drawdown) for scenario in runs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_load, initargs=shared) as pool:
+            results = list(pool.map(_run, runs, itertools.repeat(drawdown)))
+    return _table(runs, results)
+
+def report(table, f=sys.stdout):
+    'Prints the water-year totals of each scenario'
+    f.write(f"{'Scen':>4s}{'Limit':>10s} {'Init':5s}{'Season':>7s}{'Window':>7s}{'Year':>7s}{'Coll':>10s}{'Wthdrl':>10s}{'Reg':>10s}\n")
+    for row in table[table['period'] == 'wateryear']:
+        f.write(f"{row['scenario']:4d}{row['volume_limit']:10.0f} {'yes' if row['handle_init'] else 'no':5s}"
+                f"{row['season_month']:4d}-{row['season_day']:02d}{row['window']:7d}{row['end'].astype(date).year:7d}"
+                f"{row['collection']:10.0f}{-row['withdrawal']:10.0f}{row['regulation']:10.0f}\n")
+
+# Main program
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='30-day storage analysis of one CDEC reservoir under several interpretations')
+    parser.add_argument('station_id')
+    parser.add_argument('wateryear', type=int)
+    parser.add_argument('--years', type=int, default=1, help='number of water years (default 1)')
+    parser.add_argument('--volume-limits', type=float, nargs='+', default=[0], help='acre-feet; 0 for no limit')
+    parser.add_argument('--handle-init', nargs='+', choices=('yes', 'no'), default=['yes'], help='handle initial collection')
+    parser.add_argument('--season-starts', nargs='+', default=['10-01'], metavar='MM-DD', help='collection season start dates')
+    parser.add_argument('--windows', type=int, nargs='+', default=[30], help='window lengths, days')
+    parser.add_argument('--exact', action='store_true', help="classify drawdown with drawdown='exact'")
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--output', metavar='PATH', help='save the table as .csv, .jsonl, or .npy')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite file to keep CDEC data between runs')
+    parser.add_argument('--offline', action='store_true', help='use only data already in the cache')
+    parser.add_argument('--archive', metavar='PATH', help='read storage from this local archive (see archive.py) instead of CDEC')
+    args = parser.parse_args()
+
+    station_id = args.station_id.upper()
+    cache = CdecCache(args.cache) if args.cache else None
+    handler = Handler(station_id)
+    adapter = ArchiveAdapter(args.archive) if args.archive else cdecpuller.CdecDailyResAdapter(cache=cache, offline=args.offline)
+    adapter.fill(handler, date(args.wateryear-1, 9, 1), nbr_years=args.years)
+    if cache is not None: cache.close()
+
+    runs = scenarios(args.volume_limits, [h == 'yes' for h in args.handle_init],
+                     [tuple(int(x) for x in s.split('-')) for s in args.season_starts], args.windows)
+    table = sweep(handler._storage.dates, handler._storage.storage, runs,
+                  drawdown='exact' if args.exact else 'sampled', workers=args.workers)
+    report(table)
+    if args.output:
+        fmt = args.output.rsplit('.', 1)[-1]
+        with open(args.output, 'wb' if fmt == 'npy' else 'w', encoding=None if fmt == 'npy' else 'utf-8') as f:
+            exporters.write_table(table, f, fmt)
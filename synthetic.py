@@ -0,0 +1,131 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Synthetic reservoir storage records, and a local stand-in for the CDEC servlet serving them,
+# for benchmarks and for trying the program without network access
+# Kinds of record:
+#   'seasonal'    fills with winter rain and spring snowmelt, drawn down by summer demand, spills when full
+#   'refill'      seasonal, plus winter storms refilling storage which is released again within weeks
+#   'flat'        seasonal, plus spells of days with storage held unchanged
+#   'regulating'  a small reservoir cycling daily and weekly, with noisy readings
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+KINDS = ('seasonal', 'refill', 'flat', 'regulating')
+
+def storage_series(years=1, kind='seasonal', capacity=100000.0, seed=0, start='1990-09-01'):
+    'Returns (dates, storage) for years water years plus two months, storage in whole acre-feet'
+    rng = np.random.default_rng(seed)
+    n = int(round(365.25 * years)) + 62
+    dates = np.datetime64(start, 'D') + np.arange(n)
+    angle = 2 * np.pi * (dates - dates.astype('datetime64[Y]')).astype(int) / 365.25
+    if kind == 'regulating':
+        # fills overnight and weekends, drawn down on weekdays, around half full
+        weekly = np.where((dates.astype(np.int64) + 3) % 7 < 5, -1.0, 2.5)
+        storage = capacity * (0.5 + 0.1*np.cos(angle) + 0.03*np.cumsum(weekly)) + rng.normal(0, 0.01*capacity, n)
+        return dates, np.round(np.clip(storage, 0.05*capacity, capacity))
+    if kind not in KINDS:
+        raise ValueError(f'Unknown kind {kind}; use one of {KINDS}')
+
+    # daily inflow peaks in April and demand in July; wetness varies from year to year
+    wetness = rng.lognormal(0, 0.35, years + 2)[(dates - dates[0]).astype(int) // 365]
+    inflow = 0.0023 * capacity * wetness * (1 + np.cos(angle - 2*np.pi*100/365)) * rng.lognormal(0, 0.3, n)
+    demand = 0.0024 * capacity * (1 + np.cos(angle - 2*np.pi*200/365))
+    if kind == 'refill':
+        # storms from November through March, each released over the following two or three weeks
+        storms = (rng.random(n) < 0.04) & ((angle < 2*np.pi*90/365) | (angle > 2*np.pi*305/365))
+        for day in np.flatnonzero(storms):
+            size = rng.uniform(0.02, 0.08) * capacity
+            inflow[day:day+3] += size / 3
+            release = rng.integers(14, 22)
+            demand[day+5:day+5+release] += size / release
+    net = inflow - demand
+    storage = np.empty(n)
+    level = 0.5 * capacity
+    for i, change in enumerate(net.tolist()):
+        storage[i] = level
+        level = min(capacity, max(0.05 * capacity, level + change))
+    if kind == 'flat':
+        # about one spell a year of 10 to 60 days without change
+        for day in np.flatnonzero(rng.random(n) < 1/365):
+            storage[day:day+rng.integers(10, 61)] = storage[day]
+    return dates, np.round(storage)
+
+def servlet_json(station_id, dates, values, sensor_num=15, dur_code='D'):
+    'The JSONDataServlet response for these observations, as bytes; NaN values are sent as -9999'
+    if len(dates) == 0: return b'[]'
+    rows = []
+    times = np.char.replace(np.datetime_as_string(np.asarray(dates).astype('datetime64[m]'), unit='m'), 'T', ' ')
+    for time, value in zip(times.tolist(), np.asarray(values, dtype=float).tolist()):
+        value = -9999 if value != value else value
+        rows.append(f'{{"stationId":"{station_id}","durCode":"{dur_code}","SENSOR_NUM":{sensor_num},"sensorType":"STORAGE",'
+                    f'"date":"{time}","obsDate":"{time}","value":{value:g},"dataFlag":" ","units":"AF"}}')
+    return ('[' + ','.join(rows) + ']').encode()
+
+class ServletStandIn:
+    'Local HTTP server answering JSONDataServlet and QueryDaily requests from records held in memory'
+
+    # records is {station_id: (dates, values)}; dates may carry times of day, for hourly records.
+    # Point cdecpuller.CDEC_URL at self.url to use it.
+    # Counts the requests served and the bytes sent.
+    def __init__(self, records, names=None):
+        self.records = {station_id: (np.asarray(d).astype('datetime64[m]'), np.asarray(v, dtype=float)) for station_id, (d, v) in records.items()}
+        self.names = names or {}
+        self.requests = self.bytes_sent = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args): pass
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                if url.path.endswith('JSONDataServlet'):
+                    body = stand_in._servlet(query)
+                elif url.path.endswith('QueryDaily'):
+                    name = stand_in.names.get(query['s'], f"Lake {query['s']}").upper()
+                    body = f"<html><head><title>{name} ({query['s']})</title></head></html>".encode()
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stand_in.lock:
+                    stand_in.requests += 1
+                    stand_in.bytes_sent += len(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _servlet(self, query):
+        start, end = np.datetime64(query['Start'][:10], 'D'), np.datetime64(query['End'][:10], 'D')
+        parts = []
+        for station_id in query['Stations'].split(','):
+            if station_id not in self.records: continue
+            dates, values = self.records[station_id]
+            keep = (dates >= start) & (dates < end + np.timedelta64(1, 'D'))
+            parts.append(servlet_json(station_id, dates[keep], values[keep], query.get('SensorNums', 15), query.get('dur_code', 'D'))[1:-1])
+        return b'[' + b','.join(p for p in parts if p) + b']'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
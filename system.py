@@ -0,0 +1,183 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+# Reservoirs in series, analyzed together on one daily date axis
+# Storage, flags, and results are 2-D arrays with one row per reservoir.  Links say which
+# reservoirs' withdrawals flow to which others.  Collection downstream, up to the water withdrawn
+# upstream and arriving that day, is rediversion of controlled water already reported upstream;
+# only the rest is diversion to storage.  So system totals count each acre-foot of diversion once.
+# After changing a reservoir's storage or settings, compute() reclassifies only that reservoir,
+# so what-if changes to a large system take about as long as one reservoir.
+import sys, argparse, hashlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import numpy as np
+from storagehandler import Handler, StorageRecord, DailyResults, season_beginnings, complete_periods, period_sums, _window_minimums
+import cdecpuller
+from cdeccache import CdecCache
+from archive import ArchiveAdapter
+
+def _classify(job):
+    # Worker:  the daily results of one reservoir, given its rolling minimums
+    params, dates, storage, flags, minimums = job
+    handler = Handler(*params)
+    handler._storage = StorageRecord(dates, storage, flags)
+    handler.compute_deltaS(minimums=minimums)
+    return handler.cwr.values
+
+class ReservoirSystem:
+    'Several reservoirs on one daily date axis, with links carrying water withdrawn upstream to reservoirs below'
+
+    # storage has one row per station and one column per date.  handle_init and volume_limit are
+    # one value for every reservoir or a sequence with one per reservoir.
+    def __init__(self, station_ids, dates, storage, handle_init=True, volume_limit=0, window=30, drawdown='sampled'):
+        self.station_ids = list(station_ids)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        n = len(self.station_ids)
+        self.storage = np.array(storage, dtype=np.float64, ndmin=2)
+        if self.storage.shape != (n, len(self.dates)):
+            raise ValueError(f'storage must be {n} reservoirs by {len(self.dates)} days')
+        if not np.isfinite(self.storage).all():
+            raise ValueError('storage must have a value for every reservoir and day')
+        self.flags = np.zeros(self.storage.shape, dtype=np.int8)
+        self.handle_init = np.broadcast_to(np.asarray(handle_init, dtype=bool), (n,)).copy()
+        self.volume_limit = np.broadcast_to(np.asarray(volume_limit, dtype=np.float64), (n,)).copy()
+        self.window, self.drawdown = window, drawdown
+        self.links = []  # (upstream row, downstream row, fraction, lag days)
+        self.cwr = np.zeros((n, len(DailyResults.COLUMNS), len(self.dates)))
+        self._computed = [None] * n  # what each row of cwr was computed from
+
+    @classmethod
+    def from_handlers(cls, handlers, **kwargs):
+        'A system of the days common to the records of the handlers, keeping their settings'
+        first = max(h._storage.dates[0] for h in handlers)
+        last = min(h._storage.dates[-1] for h in handlers)
+        dates = np.arange(first, last + np.timedelta64(1, 'D'))
+        rows = []
+        for h in handlers:
+            keep = (h._storage.dates >= first) & (h._storage.dates <= last)
+            if not np.array_equal(h._storage.dates[keep], dates):
+                raise ValueError(f'Record of {h.station_id} is missing days between {first} and {last}')
+            rows.append(h._storage.storage[keep])
+        kwargs.setdefault('handle_init', [h.HANDLE_INIT for h in handlers])
+        kwargs.setdefault('volume_limit', [h.volume_limit for h in handlers])
+        kwargs.setdefault('window', handlers[0].window)
+        kwargs.setdefault('drawdown', handlers[0].drawdown)
+        return cls([h.station_id for h in handlers], dates, rows, **kwargs)
+
+    def index(self, station_id):
+        return self.station_ids.index(station_id)
+
+    def add_link(self, upstream, downstream, fraction=1.0, lag=0):
+        'Water withdrawn from upstream reaches downstream lag days later; fraction of it may be re-stored there'
+        if not 0 <= lag < len(self.dates):
+            raise ValueError(f'lag must be from 0 to {len(self.dates) - 1} days, not {lag}')
+        self.links.append((self.index(upstream), self.index(downstream), fraction, lag))
+
+    def set_beginnings(self, month=10, day=1):
+        # same season start for every reservoir
+        self.flags[:, season_beginnings(self.dates, month, day)] |= 4
+
+    def _inputs(self, i):
+        digest = hashlib.sha1(self.storage[i].tobytes() + self.flags[i].tobytes()).digest()
+        return digest, bool(self.handle_init[i]), float(self.volume_limit[i]), self.window, self.drawdown
+
+    def compute(self, workers=1):
+        'Classifies the days of each reservoir whose storage, flags, or settings changed since last computed'
+        stale = [i for i in range(len(self.station_ids)) if self._computed[i] != self._inputs(i)]
+        if not stale: return
+        # rolling minimums of all the changed reservoirs in one pass
+        ahead, behind = _window_minimums(self.storage[stale], self.window, 0, len(self.dates))
+        jobs = [((self.station_ids[i], bool(self.handle_init[i]), float(self.volume_limit[i]), self.window, self.drawdown),
+                 self.dates, self.storage[i], self.flags[i], (ahead[j], behind[j])) for j, i in enumerate(stale)]
+        if workers == 1:
+            results = list(map(_classify, jobs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_classify, jobs))
+        for i, values in zip(stale, results):
+            self.cwr[i] = values
+            self._computed[i] = self._inputs(i)
+
+    def collection(self):
+        'Collection to storage, (reservoir x day) acre-feet'
+        return self.cwr[:, 0] + self.cwr[:, 3]
+
+    def withdrawal(self):
+        'Withdrawal from storage, (reservoir x day) acre-feet, negative'
+        return self.cwr[:, 1] + self.cwr[:, 4]
+
+    def rediversion(self):
+        'Collection which is re-storage of water withdrawn upstream, (reservoir x day) acre-feet'
+        arriving = np.zeros(self.cwr.shape[::2])
+        withdrawn = -self.withdrawal()
+        for up, down, fraction, lag in self.links:
+            arriving[down, lag:] += fraction * withdrawn[up, :arriving.shape[1]-lag]
+        return np.minimum(self.collection(), arriving)
+
+    def totals(self, period='month'):
+        'Totals for each complete period; see SystemTotals'
+        return SystemTotals(self, period)
+
+class SystemTotals:
+    'Diversion to storage, rediversion, withdrawal, and regulation of each reservoir and of the system, by period'
+
+    # Each is a (reservoir x period) array; system_diversion and the rest are their sums over reservoirs.
+    def __init__(self, system, period='month'):
+        self.period = period
+        self.station_ids = system.station_ids
+        first, self.start, self.end = complete_periods(system.dates, period)
+        lo = first[0] if len(first) else 0
+        hi = lo + (self.end[-1] - self.start[0]).astype(int) if len(first) else 0
+        rediversion = system.rediversion()
+        daily = np.stack((system.collection() - rediversion, rediversion, system.withdrawal(), system.cwr[:, 2]), axis=1)[..., lo:hi]
+        sums = period_sums(daily, first - lo, hi - lo)
+        self.diversion, self.rediversion, self.withdrawal, self.regulation = sums.transpose(1, 0, 2)
+        self.system_diversion, self.system_rediversion, self.system_withdrawal, self.system_regulation = sums.sum(axis=0)
+
+    def text_tabulate(self, f):
+        # system totals, then each reservoir's
+        heading = f"{'Period':12s}{'Diversion':>12s}{'Rediversion':>12s}{'Withdrawal':>12s}{'Regulation':>12s}\n"
+        tables = [('System', self.system_diversion, self.system_rediversion, self.system_withdrawal, self.system_regulation)]
+        tables += [(station_id, self.diversion[i], self.rediversion[i], self.withdrawal[i], self.regulation[i])
+                   for i, station_id in enumerate(self.station_ids)]
+        for name, diversion, rediversion, withdrawal, regulation in tables:
+            f.write(f'{name}\n{heading}')
+            for ind in range(len(self.start)):
+                f.write(f'{str(self.start[ind]):12s}{diversion[ind]:12.0f}{rediversion[ind]:12.0f}{-withdrawal[ind]:12.0f}{regulation[ind]:12.0f}\n')
+            f.write('\n')
+
+# Main program
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='30-day storage analysis of CDEC reservoirs in series')
+    parser.add_argument('wateryear', type=int)
+    parser.add_argument('station_ids', nargs='+')
+    parser.add_argument('--link', action='append', default=[], metavar='UP:DOWN[:LAG]',
+                        help='withdrawals from UP flow to DOWN, arriving LAG days later (default 0); repeat for each link')
+    parser.add_argument('--years', type=int, default=1, help='number of water years (default 1)')
+    parser.add_argument('--period', choices=('month', 'week', 'wateryear'), default='month', help='reporting period')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--cache', metavar='PATH', help='SQLite file to keep CDEC data between runs')
+    parser.add_argument('--offline', action='store_true', help='use only data already in the cache')
+    parser.add_argument('--archive', metavar='PATH', help='read storage from this local archive (see archive.py) instead of CDEC')
+    args = parser.parse_args()
+
+    handlers = [Handler(station_id.upper()) for station_id in args.station_ids]
+    cache = CdecCache(args.cache) if args.cache else None
+    adapter = ArchiveAdapter(args.archive) if args.archive else cdecpuller.CdecDailyResAdapter(cache=cache, offline=args.offline)
+    adapter.fill_many(handlers, date(args.wateryear-1, 9, 1), nbr_years=args.years)
+    if cache is not None: cache.close()
+
+    system = ReservoirSystem.from_handlers(handlers)
+    for link in args.link:
+        up, down, *lag = link.upper().split(':')
+        system.add_link(up, down, lag=int(lag[0]) if lag else 0)
+    system.set_beginnings()
+    system.compute(workers=args.workers)
+    system.totals(args.period).text_tabulate(sys.stdout)
@@ -0,0 +1,75 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import io
+from datetime import date
+import numpy as np
+import pytest
+import archive, synthetic
+from adapters import fetch_end
+from storagehandler import Handler
+
+@pytest.fixture(params=('sqlite', 'memmap'))
+def store(request, tmp_path):
+    path = tmp_path / ('archive.sqlite' if request.param == 'sqlite' else 'archive')
+    opened = archive.open_archive(str(path))
+    assert isinstance(opened, archive.SqliteArchive if request.param == 'sqlite' else archive.MemmapArchive)
+    yield opened
+    opened.close()
+
+def days(first, n):
+    return np.datetime64(first) + np.arange(n).astype('timedelta64[D]')
+
+def test_store_merges_overlap(store):
+    store.store('TST', 'D', days('2019-12-20', 20), np.arange(20.))
+    # the second readings overlap the last five of the first; where both have a day, the second win
+    store.store('TST', 'D', days('2020-01-04', 10), 100 + np.arange(10.))
+    t, v = store.read('TST', 'D', date(2019, 12, 1), date(2020, 2, 1))
+    assert np.array_equal(t, days('2019-12-20', 25).astype('datetime64[m]'))
+    assert np.array_equal(v, np.concatenate((np.arange(15.), 100 + np.arange(10.))))
+
+def test_read_bounds_across_year_blocks(store):
+    t = days('2018-12-25', 800)
+    store.store('TST', 'D', t, np.arange(800.))
+    got_t, got_v = store.read('TST', 'D', date(2019, 12, 31), date(2020, 1, 1))
+    assert np.array_equal(got_t, np.array(['2019-12-31', '2020-01-01'], dtype='datetime64[m]'))
+    first = int(np.flatnonzero(t == np.datetime64('2019-12-31'))[0])
+    assert np.array_equal(got_v, [first, first + 1])
+    # a range reaching past both ends of the series, and one before it
+    assert len(store.read('TST', 'D', date(2000, 1, 1), date(2030, 1, 1))[0]) == 800
+    assert len(store.read('TST', 'D', date(2000, 1, 1), date(2018, 12, 24))[0]) == 0
+    # times of day up to the end of the end date are included
+    store.store('TST', 'H', np.array(['2020-01-01T23:00', '2020-01-02T00:00'], dtype='datetime64[m]'), [1., 2.])
+    assert np.array_equal(store.read('TST', 'H', date(2020, 1, 1), date(2020, 1, 1))[1], [1.])
+
+def test_names_and_series(store):
+    store.store('TST', 'D', days('2020-01-01', 3), [1., 2., 3.])
+    store.set_name('TST', 'Test Lake')
+    assert store.get_name('TST') == 'Test Lake' and store.get_name('ABC') is None
+    assert [tuple(s) for s in store.series()] == [('TST', 'D')]
+
+def test_load_csv(store):
+    n = archive.load_csv(store, io.StringIO('station,time,value\ntst,2020-01-01 00:00,5\nTST,2020-01-02,6\n'))
+    assert n == 2
+    assert np.array_equal(store.read('TST', 'D', date(2020, 1, 1), date(2020, 1, 2))[1], [5., 6.])
+
+def test_fill_many(store):
+    records = {station_id: synthetic.storage_series(2, kind, seed=i) for i, (station_id, kind) in enumerate((('ABC', 'refill'), ('XYZ', 'flat')))}
+    for station_id, (dates, values) in records.items():
+        store.store(station_id, 'D', dates, values)
+    adapter = archive.ArchiveAdapter(store)
+    handlers = [Handler('ABC'), Handler('XYZ')]
+    adapter.fill_many(handlers, date(1990, 9, 1), nbr_years=1)
+    for handler in handlers:
+        dates, values = records[handler.station_id]
+        n = len(handler._storage)
+        assert handler._storage.dates[-1] == np.datetime64(fetch_end(date(1990, 9, 1), 1))
+        assert np.array_equal(handler._storage.dates, dates[:n]) and np.array_equal(handler._storage.storage, values[:n])
+    with pytest.raises(ValueError):
+        adapter.fill_many([Handler('NOPE')], date(1990, 9, 1))
@@ -0,0 +1,40 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import io, os
+import pytest
+import batch, synthetic
+from archive import SqliteArchive
+
+MANIFEST = '''station,wateryear,handle_init,volume_limit
+TST,2021,,
+tst,2021,false,
+TST,2021,,80000
+ABC,2021,,
+'''
+
+def test_manifest_labels_repeated_station_years():
+    rows = batch.read_manifest(io.StringIO(MANIFEST))
+    assert [row['label'] for row in rows] == [' init true limit 0', ' init false limit 0', ' init true limit 80000', '']
+
+def test_manifest_rejects_repeated_settings():
+    with pytest.raises(ValueError):
+        batch.read_manifest(io.StringIO(MANIFEST + 'TST,2021,true,0\n'))
+
+def test_repeated_station_years_write_apart(tmp_path):
+    archive = SqliteArchive(str(tmp_path / 'archive.sqlite'))
+    for station_id, seed in (('TST', 1), ('ABC', 2)):
+        archive.store(station_id, 'D', *synthetic.storage_series(2, 'refill', seed=seed, start='2020-09-01'))
+    archive.close()
+    rows = batch.read_manifest(io.StringIO(MANIFEST))
+    results = batch.run_batch(rows, str(tmp_path / 'out'), workers=2, plot=False, archive=str(tmp_path / 'archive.sqlite'))
+    assert [err for row, timings, err, profile in results] == [None] * 4
+    outputs = os.listdir(tmp_path / 'out')
+    assert len([name for name in outputs if name.startswith('TST monthly storage 2021')]) == 3
+    assert 'ABC monthly storage 2021.txt' in outputs
@@ -0,0 +1,18 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import pytest
+import benchmark, cdecpuller, synthetic
+
+@pytest.mark.parametrize('kind', synthetic.KINDS)
+def test_fast_paths_match_reference(kind, monkeypatch):
+    # crossing index against _hit_once, parallel seasons and append against one full computation,
+    # rolling minimums, and the servlet round trip; check() points cdecpuller at its stand-in
+    monkeypatch.setattr(cdecpuller, 'CDEC_URL', cdecpuller.CDEC_URL)
+    assert benchmark.check(years=(1,), kinds=(kind,)) == {f'{kind}/1y': []}
@@ -0,0 +1,49 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+import numpy as np
+import pytest
+import cdecpuller, synthetic
+from cdeccache import CdecCache
+
+START, END = date(2018, 9, 1), date(2021, 8, 31)  # 1096 days, fetched in three pieces
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    dates, values = synthetic.storage_series(3, start=str(START))
+    with synthetic.ServletStandIn({'TST': (dates, values)}) as stand_in:
+        monkeypatch.setattr(cdecpuller, 'CDEC_URL', stand_in.url)
+        yield stand_in
+
+def failing(monkeypatch, adapter, first_day):
+    # the request for the piece starting at first_day fails, as _download reports a failed request
+    download = adapter._download
+    monkeypatch.setattr(adapter, '_download', lambda station_ids, start, end, *args:
+                        None if start == first_day else download(station_ids, start, end, *args))
+
+@pytest.mark.parametrize('cached', (False, True))
+def test_failed_piece_returns_none(stand_in, monkeypatch, tmp_path, cached):
+    cache = CdecCache(str(tmp_path / 'cache.sqlite')) if cached else None
+    adapter = cdecpuller.CdecDailyResAdapter(cache=cache)
+    failing(monkeypatch, adapter, date(2019, 9, 2))
+    assert adapter.read(['TST'], START, END) is None
+    if cached: cache.close()
+
+def test_failed_piece_is_fetched_again(stand_in, monkeypatch, tmp_path):
+    cache = CdecCache(str(tmp_path / 'cache.sqlite'))
+    adapter = cdecpuller.CdecDailyResAdapter(cache=cache)
+    failing(monkeypatch, adapter, date(2019, 9, 2))
+    assert adapter.read(['TST'], START, END) is None
+    monkeypatch.undo()
+    monkeypatch.setattr(cdecpuller, 'CDEC_URL', stand_in.url)
+    dates, values = cdecpuller.CdecDailyResAdapter(cache=cache).read(['TST'], START, END)['TST']
+    assert len(dates) == (END - START).days + 1
+    assert np.all(np.diff(dates.astype('datetime64[D]')) == np.timedelta64(1, 'D'))
+    cache.close()
@@ -0,0 +1,37 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+import exporters, sweep
+
+@pytest.fixture(scope='module')
+def sweep_table():
+    # two water years of a refill and drawdown season, under four interpretations
+    n = 365 * 2 + 62
+    t = np.arange(n)
+    storage = np.round(5000 + 3000*np.sin(2*np.pi*t/365) + 400*np.sin(2*np.pi*t/9), 1)
+    dates = np.datetime64('2020-09-01') + t.astype('timedelta64[D]')
+    return sweep.sweep(dates, storage, sweep.scenarios(volume_limits=(0, 7000), handle_init=(True, False)))
+
+@pytest.mark.parametrize('fmt', exporters.FORMATS)
+def test_sweep_table_round_trip(sweep_table, fmt, tmp_path):
+    path = tmp_path / f'sweep.{fmt}'
+    with open(path, 'wb' if fmt == 'npy' else 'w', encoding=None if fmt == 'npy' else 'utf-8') as f:
+        exporters.write_table(sweep_table, f, fmt)
+    table = exporters.read_table(path)
+    assert table.dtype.names == sweep_table.dtype.names
+    assert len(table) == len(sweep_table)
+    for name in sweep_table.dtype.names:
+        if sweep_table.dtype[name].kind == 'f':
+            # text formats keep 2 decimals
+            assert np.allclose(table[name], sweep_table[name], rtol=0, atol=.005)
+        else:
+            assert table.dtype[name].kind == sweep_table.dtype[name].kind
+            assert np.array_equal(table[name], sweep_table[name])
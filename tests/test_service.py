@@ -0,0 +1,122 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import json, threading
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import pytest
+import synthetic
+from archive import ArchiveAdapter, SqliteArchive
+from service import AnalysisService, make_server
+
+KNOWN = 300  # days of the record in the archive at first; the rest arrive later
+KEY = ('TST', 2021, 1, True, 0, 'D')
+
+@pytest.fixture
+def record():
+    return synthetic.storage_series(1, 'refill', seed=4, start='2020-09-01')
+
+@pytest.fixture
+def archive(tmp_path, record):
+    archive = SqliteArchive(str(tmp_path / 'archive.sqlite'))
+    archive.store('TST', 'D', record[0][:KNOWN], record[1][:KNOWN])
+    yield archive
+    archive.close()
+
+@pytest.fixture
+def service(archive):
+    service = AnalysisService(ArchiveAdapter(archive), workers=2, refresh=3600)
+    yield service
+    service.close()
+
+@pytest.fixture
+def url(service):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+def get(url):
+    with urlopen(url, timeout=60) as response:
+        return response.status, response.read()
+
+def status(url):
+    return json.loads(get(f'{url}/status')[1])
+
+def test_miss_then_hit(url):
+    code, first = get(f'{url}/monthlies?station=tst&wateryear=2021')
+    assert code == 200 and first.startswith(b'TST ')
+    assert (status(url)['misses'], status(url)['hits']) == (1, 0)
+    assert get(f'{url}/monthlies?station=TST&wateryear=2021') == (200, first)
+    # another format of the same analysis renders from memory without computing it again
+    code, dailies = get(f'{url}/dailies?station=TST&wateryear=2021&format=csv')
+    assert code == 200 and dailies.count(b'\n') == KNOWN + 1
+    counts = status(url)
+    assert (counts['misses'], counts['hits']) == (1, 1)
+    assert [(a['station'], a['computed'], a['responses']) for a in counts['analyses']] == [('TST', True, 2)]
+
+@pytest.mark.parametrize('path, code', (
+    ('/monthlies?station=TST', 400),                              # no water year
+    ('/monthlies?station=TST&wateryear=next', 400),
+    ('/monthlies?station=TST&wateryear=2021&format=xml', 400),
+    ('/plot?station=TST&wateryear=2021&duration=Q', 400),
+    ('/totals?station=TST&wateryear=2021', 404),                  # no such response
+    ('/monthlies?station=NOPE&wateryear=2021', 404),              # no such station
+    ))
+def test_bad_requests(url, path, code):
+    with pytest.raises(HTTPError) as error:
+        get(url + path)
+    assert error.value.code == code
+    # a failed analysis is not kept
+    assert status(url)['analyses'] == []
+
+def fresh(archive):
+    # the same response from a new service computing it over everything now archived
+    service = AnalysisService(ArchiveAdapter(archive), workers=1)
+    try:
+        return service.response('dailies', 'json', 'TST', 2021)
+    finally:
+        service.close()
+
+def test_refresh_appends_new_readings(service, archive, record):
+    service.response('dailies', 'json', 'TST', 2021)
+    entry = service.entries[KEY]
+    handler = entry.handler
+    archive.store('TST', 'D', record[0][KNOWN:KNOWN+10], record[1][KNOWN:KNOWN+10])
+    service._refresh(entry)
+    assert entry.handler is handler and len(handler._storage) == KNOWN + 10
+    assert service.refreshes == 1 and entry.responses == {}
+    assert service.response('dailies', 'json', 'TST', 2021) == fresh(archive)
+
+def test_refresh_without_new_readings(service):
+    first = service.response('monthlies', 'text', 'TST', 2021)
+    entry = service.entries[KEY]
+    service._refresh(entry)
+    assert service.refreshes == 0 and len(entry.handler._storage) == KNOWN
+    assert service.response('monthlies', 'text', 'TST', 2021) == first
+
+def test_refresh_after_a_gap_recomputes(service, archive, record):
+    service.response('dailies', 'json', 'TST', 2021)
+    entry = service.entries[KEY]
+    handler = entry.handler
+    # readings resume five days after the last one in memory
+    archive.store('TST', 'D', record[0][KNOWN+5:KNOWN+20], record[1][KNOWN+5:KNOWN+20])
+    service._refresh(entry)
+    assert entry.handler is not handler and service.refreshes == 1
+    assert entry.handler._storage.dates[-1] == record[0][KNOWN+19]
+    assert service.response('dailies', 'json', 'TST', 2021) == fresh(archive)
+
+def test_stale_request_refreshes_in_background(service, archive, record):
+    service.response('monthlies', 'text', 'TST', 2021)
+    archive.store('TST', 'D', record[0][KNOWN:KNOWN+10], record[1][KNOWN:KNOWN+10])
+    service.refresh = 0
+    service.response('monthlies', 'text', 'TST', 2021)
+    service.close()  # waits for the refresh
+    assert service.refreshes == 1 and len(service.entries[KEY].handler._storage) == KNOWN + 10
@@ -0,0 +1,62 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+import synthetic
+from storagehandler import Handler, StorageRecord
+
+def computed(dates, storage, flags=None, workers=1, **settings):
+    handler = Handler('TST', **settings)
+    handler._storage = StorageRecord(dates, storage, flags)
+    handler.set_beginnings()
+    handler.compute_deltaS(workers=workers)
+    return handler
+
+@pytest.mark.parametrize('drawdown', ('sampled', 'exact'))
+def test_struck_beginnings_cut_parallel_runs(drawdown):
+    # a struck-out season beginning resets the season like any other, so runs may be cut there
+    dates, storage = synthetic.storage_series(8, 'refill', seed=3)
+    days = dates.astype('datetime64[D]')
+    # every October 1st struck out, so every cut is at a struck day
+    flags = (days - days.astype('datetime64[M]') == np.timedelta64(0, 'D')) & (days.astype('datetime64[M]').astype(int) % 12 == 9)
+    flags = flags.astype(np.int8)
+    serial = computed(dates, storage, flags, drawdown=drawdown)
+    parallel = computed(dates, storage, flags, workers=4, drawdown=drawdown)
+    assert len(parallel._season_chunks(len(dates) - 1, 4)) > 1
+    assert np.array_equal(serial.cwr.values, parallel.cwr.values)
+
+@pytest.mark.parametrize('settings', (dict(), dict(handle_init=False), dict(drawdown='exact'), dict(volume_limit=60000.0)))
+def test_append_matches_full_computation(settings):
+    # days appended a week at a time, across a season beginning, give the final days of one full computation
+    dates, storage = synthetic.storage_series(2, 'regulating', seed=7)
+    full = computed(dates, storage, **settings)
+    first = len(dates) - 200
+    appended = computed(dates[:first], storage[:first], **settings)
+    for i in range(first, len(dates), 7):
+        appended.append(dates[i:i+7], storage[i:i+7])
+    done = appended._season.next
+    assert done > first
+    assert np.array_equal(appended.cwr.values[:, :done], full.cwr.values[:, :done])
+
+@pytest.mark.parametrize('settings', (dict(), dict(handle_init=False), dict(drawdown='exact'), dict(volume_limit=60000.0)))
+def test_parallel_seasons_match_serial(settings):
+    dates, storage = synthetic.storage_series(6, 'flat', seed=11)
+    serial = computed(dates, storage, **settings)
+    parallel = computed(dates, storage, workers=3, **settings)
+    assert np.array_equal(serial.cwr.values, parallel.cwr.values)
+
+@pytest.mark.parametrize('season_start', ((10, 1), (2, 29), (12, 31), (1, 1)))
+def test_beginnings_flag_each_season_start(season_start):
+    dates = np.datetime64('1999-01-01') + np.arange(9000).astype('timedelta64[D]')
+    handler = Handler('TST')
+    handler._storage = StorageRecord(dates, np.zeros(len(dates)))
+    handler.set_beginnings(*season_start)
+    expected = [(d.month, d.day) == season_start for d in dates.astype(object)]
+    assert (handler._storage.flags & 4 != 0).tolist() == expected
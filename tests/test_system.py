@@ -0,0 +1,31 @@
+## Copyright 2025 D.E.McFadden, III
+
+## This file is part of Mork30.
+## Mork30 is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License
+## as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+## Mork30 is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+## of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+## You should have received a copy of the GNU General Public License along with Mork30. If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+import synthetic
+from system import ReservoirSystem
+
+@pytest.fixture
+def system():
+    records = [synthetic.storage_series(1, kind, seed=i) for i, kind in enumerate(('seasonal', 'refill'))]
+    return ReservoirSystem(['UP', 'DN'], records[0][0], np.array([r[1] for r in records]))
+
+@pytest.mark.parametrize('lag', (-1, 'days'))
+def test_add_link_rejects_lags_outside_the_record(system, lag):
+    lag = len(system.dates) if lag == 'days' else lag
+    with pytest.raises(ValueError):
+        system.add_link('UP', 'DN', lag=lag)
+    assert system.links == []
+
+def test_longest_lag(system):
+    system.add_link('UP', 'DN', lag=len(system.dates) - 1)
+    system.set_beginnings()
+    system.compute()
+    assert system.rediversion().shape == system.storage.shape